@@ -1,5 +1,6 @@
 import asyncio
 from decimal import Decimal
+from typing import Dict
 from exchanges.base_exchange import BaseExchange
 from helpers import run_async_repeatedly
 from logger import get_logger
@@ -30,6 +31,11 @@ class AccountInfo:
         except KeyError:
             return Decimal('0')
 
+    def get_balances(self, assets) -> Dict[str, Decimal]:
+        # all from the same snapshot, even if it gets updated meanwhile
+        balances = self._balances
+        return {asset: balances.get(asset, Decimal('0')) for asset in assets}
+
     async def update_info(self):
         try:
             self._balances = await self._exchange.load_balances()
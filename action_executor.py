@@ -3,7 +3,6 @@ import asyncio
 from pydispatch import dispatcher
 from decimal import Decimal, ROUND_DOWN
 from typing import List, Tuple
-from collections import deque
 from config import config, get_exchange_class
 from exchanges.base_exchange import BaseExchange
 from account_info import AccountInfo
@@ -11,6 +10,8 @@ from arbitrage_detector import ArbitrageDetector, Arbitrage
 from logger import get_logger
 logger = get_logger(__name__)
 
+OPPOSITE_SIDE = {'BUY': 'SELL', 'SELL': 'BUY'}
+
 
 class ActionError(Exception):
     def __init__(self, message):
@@ -18,15 +19,23 @@ class ActionError(Exception):
 
 
 class Action:
+    __slots__ = ('pair', 'side', 'quantity', 'price', 'type')
+
     def __init__(self, pair: Tuple[str, str], side: str, quantity, price=None, order_type='LIMIT'):
         self.pair = pair
-        self.base = pair[0]
-        self.quote = pair[1]
         self.side = side.upper()
         self.quantity = quantity
         self.price = price
         self.type = order_type.upper()
 
+    @property
+    def base(self) -> str:
+        return self.pair[0]
+
+    @property
+    def quote(self) -> str:
+        return self.pair[1]
+
     def __str__(self):
         s = f'{self.type} {self.side} {self.quantity:f} {self.base}/{self.quote}'
         if self.type != 'MARKET':
@@ -74,10 +83,15 @@ class ActionExecutor:
         self._exchange = exchange
         self._symbols_info = exchange.get_symbols_info()
         self._raw_action_list = actions
+        # all the actions, including emergency ones, are performed on the pairs of the initial actions
+        self._pair_symbols = {action.pair: exchange.make_symbol(action.base, action.quote) for action in actions}
+        self._pair_amount_steps = {
+            pair: self._symbols_info[symbol]['amount_step'] for pair, symbol in self._pair_symbols.items()
+        }
         self._account_info = account_info
         self._detector = detector
         self._arbitrage = arbitrage
-        self._trade_fee = config.getdecimal('Exchange', 'TradeFee')
+        self._fee_complement = 1 - config.getdecimal('Exchange', 'TradeFee')
         self._min_fill_time = config.getint('Arbitrage', 'MinFillTime')
         self._min_fill_time_last = config.getint('Arbitrage', 'MinFillTimeLast')
         self._max_fill_time = config.getint('Arbitrage', 'MaxFillTime')
@@ -95,6 +109,13 @@ class ActionExecutor:
         self._stopped = asyncio.Event()
 
     async def run(self):
+        if not self._exchange.is_available():
+            logger.info('Cannot execute these actions: exchange is unavailable')
+            dispatcher.send(signal='execution_finished', sender=self)
+            if self._stopping:
+                self._stopped.set()
+            return
+
         # init account info if it hasn't been passed from above
         if self._account_info is None:
             self._account_info = await AccountInfo.create(self._exchange)
@@ -112,6 +133,8 @@ class ActionExecutor:
 
         # emergency actions in case of any failures
         emergency_actions = []
+        # unless one of them needs the funds another one brings back, they go in parallel
+        emergency_sequential = False
 
         # execute each step one by one
         for step, actions in enumerate(action_set.steps):
@@ -233,6 +256,8 @@ class ActionExecutor:
                     emergency_actions.extend(to_revert)
                     logger.info('And reverting step 1...')
                     emergency_actions.append(self._revert_action(action_set.steps[0][0]))
+                    # reverting step 1 spends what reverting step 2 brings back
+                    emergency_sequential = True
                     scenario = 'reverted 2' if len(to_revert) > 0 else 'reverted 1'
                 else:
                     logger.info('Last step failed, it will be finalized')
@@ -288,8 +313,11 @@ class ActionExecutor:
             self._timings['orders_placed'][j] = placed_in
 
         # perform emergency actions
-        for action in emergency_actions:
-            await self._execute_emergency_action(action)
+        if emergency_sequential:
+            for action in emergency_actions:
+                await self._execute_emergency_action(action)
+        else:
+            await asyncio.gather(*[self._execute_emergency_action(action) for action in emergency_actions])
 
         self._timings['completed'] = int(time.time() * 1000) - self._arbitrage.ts
 
@@ -331,7 +359,7 @@ class ActionExecutor:
             logger.error('Failed to execute emergency action!')
             return
         try:
-            status = await self._get_order_status(result)
+            status = await self._get_order_status(result, action.type)
         except ActionError:
             logger.error(f'Unexpected result of emergency action, server response: {result}')
             return
@@ -347,47 +375,32 @@ class ActionExecutor:
         if len(actions) != 3:
             raise self.Error(f'Number of actions is not 3: {actions}')
         # first rearrange actions in a sequence to pass funds along the sequence
-        gain = []
-        spend = []
-        for action in actions:
-            if action.side == 'BUY':
-                gain.append(action.base)
-                spend.append(action.quote)
-            else:
-                gain.append(action.quote)
-                spend.append(action.base)
-        if gain[0] == spend[1] and gain[1] == spend[2] and gain[2] == spend[0]:
+        # what each action gains and spends, and how much it spends
+        gain, spend, spend_amounts = zip(*[
+            (action.base, action.quote, action.quantity * action.price) if action.side == 'BUY'
+            else (action.quote, action.base, action.quantity)
+            for action in actions
+        ])
+        # each action must spend what the previous one gains, in a cycle
+        if spend == (gain[2], gain[0], gain[1]):
             # sequence is already fine
             pass
-        elif gain[0] == spend[2] and gain[2] == spend[1] and gain[1] == spend[0]:
+        elif spend == (gain[1], gain[2], gain[0]):
             # sequence needs to be rearranged
             actions = [actions[0], actions[2], actions[1]]
+            spend = (spend[0], spend[2], spend[1])
+            spend_amounts = (spend_amounts[0], spend_amounts[2], spend_amounts[1])
         else:
             raise self.Error(f'Bad actions list: not a valid triangle! Actions: {actions}')
         # logger.debug(f'Sequenced actions list: {actions}')
         # then figure out which action to start with and rotate the sequence
-        balance_props = []
-        for action in actions:
-            side = action.side
-            base = action.base
-            quote = action.quote
-            quantity = action.quantity
-            price = action.price
-
-            if side == 'BUY':
-                asset = quote
-                amount = quantity * price
-            else:
-                asset = base
-                amount = quantity
-            balance = self._account_info.get_balance(asset)
-            logger.debug(f'{asset} balance: {balance:.8f}')
-            balance_props.append(balance / amount)
-        prop_min, prop_mid, prop_max = sorted(balance_props)
-        logger.debug(f'Balance proportions: {balance_props}')
-        idx_min = balance_props.index(prop_min)
-        idx_mid = balance_props.index(prop_mid)
-        idx_max = balance_props.index(prop_max)
+        balances = self._account_info.get_balances(spend)
+        logger.debug('Balances: %s', balances)
+        balance_props = [balances[asset] / amount for asset, amount in zip(spend, spend_amounts)]
+        logger.debug('Balance proportions: %s', balance_props)
+        # sorting indices rather than values keeps them distinct even when proportions are equal
+        idx_min, idx_mid, idx_max = sorted(range(3), key=balance_props.__getitem__)
+        prop_min, prop_mid, prop_max = balance_props[idx_min], balance_props[idx_mid], balance_props[idx_max]
         # availability 3/3: first check the lowest balance/amount proportion
         red_actions = self._reduce_actions_by_proportion(actions, prop_min)
         if red_actions is not None:
@@ -410,12 +423,9 @@ class ActionExecutor:
         if red_actions is not None:
             # 1/3 available, execute actions sequentially one by one
             # rotate to have the one with available balance first
-            shift = -idx_max
-            if shift != 0:
-                dq = deque(red_actions)
-                # logger.debug(f'Rotating actions list by: {shift}')
-                dq.rotate(shift)
-                red_actions = list(dq)
+            if idx_max != 0:
+                # logger.debug(f'Rotating actions list by: {-idx_max}')
+                red_actions = red_actions[idx_max:] + red_actions[:idx_max]
             return ActionSet([
                 [red_actions[0],],
                 [red_actions[1],],
@@ -439,17 +449,15 @@ class ActionExecutor:
                 logger.debug('Arbitrage is not available with reduced amounts')
                 return None
             # extract amounts from the reduced arbitrage
+            reduced_actions = {(a.pair, a.action.upper()): a for a in reduced.actions}
             for action in actions:
-                a = next((
-                    a for a in reduced.actions if a.pair == action.pair and a.action.upper() == action.side
-                ), None)
-                action.quantity = a.amount
+                action.quantity = reduced_actions[(action.pair, action.side)].amount
             # logger.debug(f'Reduced arbitrage actions list: {actions}')
         return actions
 
     async def _execute_action(self, action: Action) -> BaseExchange.OrderResult or None:
         try:
-            symbol = self._exchange.make_symbol(action.pair[0], action.pair[1])
+            symbol = self._pair_symbols[action.pair]
             ores = await self._exchange.create_order(
                 symbol=symbol,
                 side=action.side,
@@ -464,12 +472,13 @@ class ActionExecutor:
             logger.error(f'Action failed: {action}. Reason: {e.message}')
             return None
 
-    async def _get_order_status(self, order_result: BaseExchange.OrderResult) -> str:
+    async def _get_order_status(self, order_result: BaseExchange.OrderResult, order_type: str) -> str:
         try:
             status = order_result.status
         except KeyError:
             raise ActionError('Status not found')
-        if status == 'NEW':
+        # a market order is done by the time it is placed, its status is already final
+        if status == 'NEW' and order_type != 'MARKET':
             try:
                 order_result = await self._exchange.get_order_result(order_result.symbol, order_result.order_id)
             except BaseExchange.Error as e:
@@ -482,7 +491,8 @@ class ActionExecutor:
         """Returns result with amount that got filled, the rest is considered failed to fill"""
 
         if ores.status in ['NEW', 'PARTIALLY_FILLED']:
-            started = time.time()
+            loop = asyncio.get_running_loop()
+            started = loop.time()
             # keep checking until it gets filled or lost in the book
             while not self._stopping:
                 try:
@@ -495,7 +505,8 @@ class ActionExecutor:
                     elif ores.status not in ['NEW', 'PARTIALLY_FILLED']:
                         logger.error(f'Unexpected order status: {ores.status}')
                         break
-                    if time.time() - started > min_filling_time:
+                    elapsed = loop.time() - started
+                    if elapsed > min_filling_time:
                         # give up if the order is lost in the book
                         amount_left = ores.amount_original - ores.amount_executed
                         if amount_left > 0:
@@ -508,32 +519,31 @@ class ActionExecutor:
                                     f' is already in front of the order'
                                 )
                                 break
-                    if time.time() - started > max_filling_time:
+                    if elapsed > max_filling_time:
                         logger.info(
                             f'Max waiting time reached, order filled by '
                             f'{ores.amount_executed:f} of {ores.amount_original:f}'
                         )
                         break
-                await asyncio.sleep(config.getint('Arbitrage', 'CheckOrderInterval'))
+                await self._exchange.wait_order_update(
+                    ores.symbol, ores.order_id, config.getint('Arbitrage', 'CheckOrderInterval')
+                )
         if ores.status == 'FILLED':
             ores.done_at = int(time.time() * 1000)
         return ores
 
+    async def _refresh_order_result(self, old_r: BaseExchange.OrderResult) -> BaseExchange.OrderResult:
+        if old_r.status not in ['NEW', 'PARTIALLY_FILLED']:
+            return old_r
+        try:
+            return await self._exchange.get_order_result(old_r.symbol, old_r.order_id)
+        except BaseExchange.Error as e:
+            logger.error(f'Failed to get order info, order: {old_r.symbol}:{old_r.order_id}, error: {e.message}')
+            return old_r
+
     async def _refresh_order_results(self, old_results: List[BaseExchange.OrderResult]):
-        # check each order's result afresh
-        order_results = []
-        for old_r in old_results:
-            try:
-                if old_r.status in ['NEW', 'PARTIALLY_FILLED']:
-                    new_r = await self._exchange.get_order_result(old_r.symbol, old_r.order_id)
-                else:
-                    new_r = old_r
-            except BaseExchange.Error as e:
-                logger.error(f'Failed to get order info, order: {old_r.symbol}:{old_r.order_id}, error: {e.message}')
-                order_results.append(old_r)
-            else:
-                order_results.append(new_r)
-        return order_results
+        # check each order's result afresh, all at once
+        return list(await asyncio.gather(*[self._refresh_order_result(old_r) for old_r in old_results]))
 
     async def _wait_all_to_fill(self, old_results: list, min_filling_time: int, max_filling_time: int) -> list:
         # wait to fill each
@@ -543,22 +553,32 @@ class ActionExecutor:
         # check each order's result one more time, as it may have changed after waiting
         return await self._refresh_order_results(old_results)
 
-    def _revert_action(self, action: Action) -> Action:
-        symbol = self._exchange.make_symbol(action.pair[0], action.pair[1])
-        amount_step = self._symbols_info[symbol]['amount_step']
-        amount_revert = (action.quantity * (1 - self._trade_fee)).quantize(amount_step, rounding=ROUND_DOWN)
+    def _revert_action(self, action: Action, amount_filled: Decimal = None) -> Action:
+        """Reverts the filled amount of the action, all of it if not specified"""
+
+        if amount_filled is None:
+            amount_filled = action.quantity
+        amount_step = self._pair_amount_steps[action.pair]
+        amount_revert = (amount_filled * self._fee_complement).quantize(amount_step, rounding=ROUND_DOWN)
         return Action(
             pair=action.pair,
-            side='BUY' if action.side == 'SELL' else 'SELL',
+            side=OPPOSITE_SIDE[action.side],
             quantity=amount_revert,
             order_type='MARKET'
         )
 
-    def _finalize_action(self, action: Action) -> Action:
+    def _finalize_action(self, action: Action, amount_filled: Decimal = None) -> Action:
+        """Finalizes the unfilled amount of the action, all of it if not specified"""
+
+        if amount_filled is None:
+            amount_to_finalize = action.quantity
+        else:
+            amount_step = self._pair_amount_steps[action.pair]
+            amount_to_finalize = (action.quantity - amount_filled).quantize(amount_step, rounding=ROUND_DOWN)
         return Action(
             pair=action.pair,
             side=action.side,
-            quantity=action.quantity,
+            quantity=amount_to_finalize,
             order_type='MARKET'
         )
 
@@ -601,17 +621,7 @@ class ActionExecutor:
         # revert what's been filled
         if amount_filled > 0:
             logger.info(f'Order has been filled for {amount_filled:f} {action.base}, it will be reverted')
-            symbol = self._exchange.make_symbol(action.pair[0], action.pair[1])
-            amount_step = self._symbols_info[symbol]['amount_step']
-            amount_revert = (amount_filled * (1 - self._trade_fee)).quantize(amount_step, rounding=ROUND_DOWN)
-            return [
-                Action(
-                    pair=action.pair,
-                    side='BUY' if action.side == 'SELL' else 'SELL',
-                    quantity=amount_revert,
-                    order_type='MARKET'
-                )
-            ]
+            return [self._revert_action(action, amount_filled)]
         return []
 
     async def _cancel_and_finalize(self, ores: BaseExchange.OrderResult, action: Action) -> List[Action]:
@@ -621,21 +631,12 @@ class ActionExecutor:
         amount_filled = await self._cancel_order(ores)
         # finalize what's unfilled
         if amount_filled < action.quantity:
-            symbol = self._exchange.make_symbol(action.pair[0], action.pair[1])
-            amount_step = self._symbols_info[symbol]['amount_step']
-            amount_to_finalize = (action.quantity - amount_filled).quantize(amount_step, rounding=ROUND_DOWN)
+            to_finalize = self._finalize_action(action, amount_filled)
             logger.info(
                 f'Order has been filled for {amount_filled:f} {action.base}, '
-                f'to be finalized: {amount_to_finalize:f} {action.base}'
+                f'to be finalized: {to_finalize.quantity:f} {action.base}'
             )
-            return [
-                Action(
-                    pair=action.pair,
-                    side=action.side,
-                    quantity=amount_to_finalize,
-                    order_type='MARKET'
-                )
-            ]
+            return [to_finalize]
         return []
 
 
@@ -1,3 +1,4 @@
+import asyncio
 from datetime import datetime
 from typing import List
 from decimal import Decimal
@@ -5,7 +6,7 @@ from pydispatch import dispatcher
 from config import config
 from exchanges.base_exchange import BaseExchange
 from action_executor import ActionExecutor, Action
-from database import db, DBArbResult
+from database import db, db_executor, DBArbResult
 from logger import get_logger
 logger = get_logger(__name__)
 
@@ -38,21 +39,20 @@ class Aftermath:
             assets[2]: Decimal(0)   # profit C
         }
         fillings = [-1, -1, -1]
-        for ores in self._result.order_results:
-            try:
-                ores = await self._exchange.get_order_result(ores.symbol, ores.order_id)
-            except BaseExchange.Error as e:
-                logger.error(f'Failed to get order result: {ores.symbol}:{ores.order_id}. Reason: {e.message}')
+        fee_complement = 1 - config.getdecimal('Exchange', 'TradeFee')  # share of the amount left after the fee
+        order_results = await asyncio.gather(*[
+            self._get_order_result(ores) for ores in self._result.order_results
+        ])
+        for ores in order_results:
             base, quote = pairs[ores.symbol]
             # calculate profit if information is available
             if ores.amount_quote is not None:
-                trade_fee = config.getdecimal('Exchange', 'TradeFee')
                 if ores.side == 'BUY':
-                    profits[base] += ores.amount_executed * (1 - trade_fee)
+                    profits[base] += ores.amount_executed * fee_complement
                     profits[quote] -= ores.amount_quote
                 elif ores.side == 'SELL':
                     profits[base] -= ores.amount_executed
-                    profits[quote] += ores.amount_quote * (1 - trade_fee)
+                    profits[quote] += ores.amount_quote * fee_complement
                 else:
                     logger.error(f'Bad side: {ores.side}')
                     return
@@ -110,7 +110,7 @@ class Aftermath:
                     else:
                         logger.error(f'Total profit equivalent calculation failed, pair not found for {asset}')
 
-        DBArbResult.create(
+        row = dict(
             dt = datetime.utcnow(),
             triangle = triangle,
             parallels = self._result.parallels,
@@ -132,6 +132,20 @@ class Aftermath:
             done_3_in = self._result.timings['orders_done'][2],
             completed_in = self._result.timings['completed']
         )
-        db.close()
+        await asyncio.get_running_loop().run_in_executor(db_executor, self._save_result, row)
 
         dispatcher.send(signal='aftermath_done', sender=self)
+
+    async def _get_order_result(self, ores: BaseExchange.OrderResult) -> BaseExchange.OrderResult:
+        # the final state of the order, or what we know about it if that fails
+        try:
+            return await self._exchange.get_order_result(ores.symbol, ores.order_id)
+        except BaseExchange.Error as e:
+            logger.error(f'Failed to get order result: {ores.symbol}:{ores.order_id}. Reason: {e.message}')
+            return ores
+
+    @staticmethod
+    def _save_result(row: dict):
+        # runs in the database thread
+        DBArbResult.create(**row)
+        db.close()
@@ -6,12 +6,18 @@ from typing import Dict, Tuple, List
 from itertools import combinations
 from config import config, get_exchange_class
 from exchanges.base_exchange import BaseExchange
+from exchanges.base_orderbook import BaseOrderbook
 from helpers import dispatcher_connect_threadsafe
 from logger import get_logger
 logger = get_logger(__name__)
 
+# arbitrage directions in the triangle, index is used as the direction bit
+DIRECTIONS = ('sell buy sell', 'buy sell buy')
+
 
 class MarketAction:
+    __slots__ = ('pair', 'action', 'price', 'amount')
+
     def __init__(self, pair: Tuple[str, str], action: str, price: Decimal, amount: Decimal):
         self.pair = pair
         self.action = action
@@ -26,6 +32,11 @@ class MarketAction:
 
 
 class Arbitrage:
+    __slots__ = (
+        'actions', 'currency_z', 'amount_z', 'profit_z', 'profit_z_rel',
+        'profit_y', 'currency_y', 'profit_x', 'currency_x', 'orderbooks', 'ts'
+    )
+
     def __init__(
             self, actions, currency_z, amount_z, profit_z, profit_z_rel,
             profit_x, currency_x, profit_y, currency_y, orderbooks, ts
@@ -69,17 +80,26 @@ class ArbitrageDetector:
         """
         self._exchange = exchange
         self._fee = fee
+        self._fee_complement = 1 - fee  # share of the amount left after paying the fee
+        self._fee_complement_cubed = self._fee_complement ** 3  # same, after three trades
         self._min_profit = min_profit
         self._min_depth = min_depth
         self._min_age = min_age * 1000  # converting to milliseconds
         self._reduce_factor = reduce_factor
         self._orderbooks = {}
-        # existing arbitrages is a map of millisecond-timestamps of when the arbitrage was found, to then check its age
-        self._existing_arbitrages = {}  # {'pair pair pair': {'buy sell buy': ..., 'sell buy sell': ...}}
 
         symbols_info = self._exchange.get_symbols_info()
         self._triangles = self._make_triangles(symbols_info)
         self._triangles, self._symbols = self._verify_triangles(self._triangles)
+        # per triangle: (id, (YZ, XZ, XY) symbols, 'YZ XZ XY' pairs string to report)
+        self._triangle_info = {}
+        for i, triangle in enumerate(self._triangles):
+            symbols = tuple(self._exchange.make_symbol(base, quote) for base, quote in triangle)
+            self._triangle_info[triangle] = (i, symbols, '{} {} {}'.format(*symbols))
+        self._symbol_triangles = {symbol: tuple(info['triangles']) for symbol, info in self._symbols.items()}
+        # existing arbitrages is a map of millisecond-timestamps of when the arbitrage was found, to then check its age
+        # key: triangle_id * 2 + direction bit (see DIRECTIONS), value: timestamp; no key if there is no arbitrage
+        self._existing_arbitrages = {}
         # logger.info(f'Triangles: {self._triangles}')
         # logger.info(f'Symbols: {self._symbols}')
 
@@ -172,11 +192,9 @@ class ArbitrageDetector:
 
     def get_book_volume_in_front(self, symbol: str, price: Decimal, side: str) -> Decimal:
         if side == 'BUY':
-            bids = self._orderbooks[symbol].get_bids()
-            return sum([v for p, v in bids if p > price])
+            return self._orderbooks[symbol].get_bids_volume_above(price)
         elif side == 'SELL':
-            asks = self._orderbooks[symbol].get_asks()
-            return sum([v for p, v in asks if p < price])
+            return self._orderbooks[symbol].get_asks_volume_below(price)
 
     @staticmethod
     def _make_asset_dicts(symbols_info: Dict[str, Dict[str, str]]) -> Tuple[dict, dict]:
@@ -274,46 +292,8 @@ class ArbitrageDetector:
         # logger.info(f'Arbitrage found: {arbitrage}')
         dispatcher.send(signal='arbitrage_detected', sender=self, arb=arbitrage)
 
-    def _calculate_amounts_on_price_level(self, direction: str, yz: tuple, xz: tuple, xy: tuple) -> tuple:
-        """
-        Calculates available trade amount on one depth level in the triangle.
-
-        :param direction: 'sell buy sell' or 'buy sell buy'
-        :param yz: (price: Decimal, amount: Decimal) on Y/Z
-        :param xz: (price: Decimal, amount: Decimal) on X/Z
-        :param xy: (price: Decimal, amount: Decimal) on X/Y
-        :return: (amount_y, amount_x_buy, amount_x_sell) - amounts to use for the orders
-        """
-        amount_x = min(xz[1], xy[1])
-        amount_y = amount_x * xy[0]
-        amount_x_sell = amount_x  # this much we can sell for sure
-        amount_x_buy = amount_x_sell / (1 - self._fee)  # plus the fee, that's how much X we must buy
-        if direction == 'sell buy sell':
-            if amount_x_buy > xz[1]:  # if we can't buy enough X on X/Z
-                amount_x_buy = xz[1]  # then we buy as much X as we can on X/Z
-                amount_x_sell = amount_x_buy * (1 - self._fee)  # => minus the fee, that's how much X we can sell on X/Y
-            amount_y = amount_x_sell * xy[0] * (1 - self._fee)  # Y we get from selling X, that we can sell on Y/Z
-        elif direction == 'buy sell buy':
-            if amount_x_buy > xy[1]:  # if we can't buy enough X on X/Y
-                amount_x_buy = xy[1]  # then buy as much X as we can on X/Y
-                amount_x_sell = amount_x_buy * (1 - self._fee)  # => minus the fee, that's how much X we can sell on X/Z
-            amount_y = amount_x_buy * xy[0] / (1 - self._fee)  # Y we spend to buy X, plus the fee, we must buy on Y/Z
-        if amount_y > yz[1]:  # if we can't trade that much Y on Y/Z
-            amount_y = yz[1]  # then trade as much Y as we can on Y/Z
-            if direction == 'sell buy sell':
-                amount_x_sell = amount_y / xy[0] / (1 - self._fee)  # this much X we must sell on X/Y to have enough Y
-                amount_x_buy = amount_x_sell / (1 - self._fee)  # plus the fee, this much X we must buy on X/Z
-            elif direction == 'buy sell buy':
-                amount_x_buy = amount_y * (1 - self._fee) / xy[0]  # this much X we must buy on X/Y to spend our Y
-                amount_x_sell = amount_x_buy * (1 - self._fee)  # minus the fee, this much X we can sell
-        # integrity check, have we calculated everything correctly?
-        if (amount_y > yz[1] or ((amount_x_buy > xz[1] or amount_x_sell > xy[1]) and direction == 'sell buy sell')
-                             or ((amount_x_sell > xz[1] or amount_x_buy > xy[1]) and direction == 'buy sell buy')):
-            raise Exception('Bad calculation!')
-        return amount_y, amount_x_buy, amount_x_sell
-
     @staticmethod
-    def _calculate_counter_amount(amount: Decimal, orderbook: List[Tuple[Decimal, Decimal]]) -> Tuple[Decimal, Decimal]:
+    def _calculate_counter_amount(amount: Decimal, orderbook: List[Tuple[Decimal, Decimal]]) -> Decimal:
         """
         Goes through the orderbook and calculates the amount of counter currency.
 
@@ -324,17 +304,11 @@ class ArbitrageDetector:
         counter_amount = Decimal(0)
         amount_left = amount
         for level_price, level_amount in orderbook:
-            if amount_left > level_amount:
-                trade_amount = level_amount
-            else:
-                trade_amount = amount_left
-            counter_amount += level_price * trade_amount
-            amount_left -= trade_amount
-            if amount_left <= 0:
-                break
-        if amount_left < 0:
-            logger.critical(f'calculate_counter_amount() is bad: amount_left is negative: {amount_left}')
-            raise Exception('Critical calculation error')
+            if amount_left <= level_amount:
+                # the rest fits into this level, we are done
+                return counter_amount + level_price * amount_left
+            counter_amount += level_price * level_amount
+            amount_left -= level_amount
         return counter_amount
 
     def _normalize_amounts(self, amounts: Dict[str, Decimal], amounts_to_symbols: Dict[str, str], prices: Dict[str, Decimal]):
@@ -351,22 +325,23 @@ class ArbitrageDetector:
         amounts_new = {}
         for amount_type, symbol in amounts_to_symbols.items():
             # check that we have all symbols info
-            if symbol not in self._symbol_reqs:
+            reqs = self._symbol_reqs.get(symbol)
+            if reqs is None:
                 logger.warning(f'Missing {symbol} symbol filters. Normalization failed.')
                 return None
+            amount = amounts[amount_type]
             # make sure that min_amount <= order amount <= max_amount
-            if amounts[amount_type] < self._symbol_reqs[symbol]['min_amount']:
+            if amount < reqs['min_amount']:
                 return None
-            elif amounts[amount_type] > self._symbol_reqs[symbol]['max_amount']:
-                amounts_new[amount_type] = self._symbol_reqs[symbol]['max_amount']
+            elif amount > reqs['max_amount']:
+                amount = reqs['max_amount']
             else:
                 # round order amount precision to amount_step
-                amounts_new[amount_type] = amounts[amount_type].quantize(
-                    self._symbol_reqs[symbol]['amount_step'], rounding=ROUND_DOWN
-                )
+                amount = amount.quantize(reqs['amount_step'], rounding=ROUND_DOWN)
             # check that amount * price >= min_total
-            if amounts_new[amount_type] * prices[symbol] < self._symbol_reqs[symbol]['min_total']:
+            if amount * prices[symbol] < reqs['min_total']:
                 return None  # amount is too little
+            amounts_new[amount_type] = amount
         return amounts_new
 
     def _normalize_amounts_and_recalculate(
@@ -398,7 +373,7 @@ class ArbitrageDetector:
                 return None
             # make sure x_profit >= 0
             while 1:
-                amounts_new['x_profit'] = amounts_new['x_buy'] * (1 - self._fee) - amounts_new['x_sell']
+                amounts_new['x_profit'] = amounts_new['x_buy'] * self._fee_complement - amounts_new['x_sell']
                 if amounts_new['x_profit'] >= 0:
                     break
                 amounts_new['x_sell'] -= self._symbol_reqs[xy]['amount_step']
@@ -406,8 +381,8 @@ class ArbitrageDetector:
                     return None
             # make sure y_profit >= 0
             while 1:
-                y_got = self._calculate_counter_amount(amounts_new['x_sell'], orderbooks[xy]) * (1 - self._fee)
-                y_got_min = amounts_new['x_sell'] * prices[xy] * (1 - self._fee)
+                y_got = self._calculate_counter_amount(amounts_new['x_sell'], orderbooks[xy]) * self._fee_complement
+                y_got_min = amounts_new['x_sell'] * prices[xy] * self._fee_complement
                 y_spend = amounts_new['y']
                 amounts_new['y_profit'] = y_got - y_spend
                 if amounts_new['y_profit'] >= 0 and y_spend <= y_got_min:
@@ -416,11 +391,11 @@ class ArbitrageDetector:
                 if amounts_new['y'] < self._symbol_reqs[yz]['min_amount']:
                     return None
             # recalculate z_spend and z_profit with new amounts
-            z_got = self._calculate_counter_amount(amounts_new['y'], orderbooks[yz]) * (1 - self._fee)
+            z_got = self._calculate_counter_amount(amounts_new['y'], orderbooks[yz]) * self._fee_complement
             amounts_new['z_spend'] = self._calculate_counter_amount(amounts_new['x_buy'], orderbooks[xz])
             amounts_new['z_profit'] = z_got - amounts_new['z_spend']
             # make sure we're profitable even with a slippage all the way to our limit prices
-            z_got_min = amounts_new['y'] * prices[yz] * (1 - self._fee)
+            z_got_min = amounts_new['y'] * prices[yz] * self._fee_complement
             z_spend_max = amounts_new['x_buy'] * prices[xz]
             if z_got_min < z_spend_max:
                 return None
@@ -430,7 +405,7 @@ class ArbitrageDetector:
                 return None
             # make sure y_profit >= 0
             while 1:
-                y_got = amounts_new['y'] * (1 - self._fee)
+                y_got = amounts_new['y'] * self._fee_complement
                 y_spend = self._calculate_counter_amount(amounts_new['x_buy'], orderbooks[xy])
                 y_spend_max = amounts_new['x_buy'] * prices[xy]
                 amounts_new['y_profit'] = y_got - y_spend
@@ -441,18 +416,18 @@ class ArbitrageDetector:
                     return None
             # make sure x_profit >= 0
             while 1:
-                amounts_new['x_profit'] = amounts_new['x_buy'] * (1 - self._fee) - amounts_new['x_sell']
+                amounts_new['x_profit'] = amounts_new['x_buy'] * self._fee_complement - amounts_new['x_sell']
                 if amounts_new['x_profit'] >= 0:
                     break
                 amounts_new['x_sell'] -= self._symbol_reqs[xz]['amount_step']
                 if amounts_new['x_sell'] < self._symbol_reqs[xz]['min_amount']:
                     return None
             # recalculate z_spend and z_profit with new amounts
-            z_got = self._calculate_counter_amount(amounts_new['x_sell'], orderbooks[xz]) * (1 - self._fee)
+            z_got = self._calculate_counter_amount(amounts_new['x_sell'], orderbooks[xz]) * self._fee_complement
             amounts_new['z_spend'] = self._calculate_counter_amount(amounts_new['y'], orderbooks[yz])
             amounts_new['z_profit'] = z_got - amounts_new['z_spend']
             # make sure we're profitable even with a slippage all the way to our limit prices
-            z_got_min = amounts_new['x_sell'] * prices[xz] * (1 - self._fee)
+            z_got_min = amounts_new['x_sell'] * prices[xz] * self._fee_complement
             z_spend_max = amounts_new['y'] * prices[yz]
             if z_got_min < z_spend_max:
                 return None
@@ -475,129 +450,249 @@ class ArbitrageDetector:
         new_amounts = {k: v*reduce_factor for k, v in amounts.items()}
         return new_amounts
 
-    def _find_arbitrage_in_triangle(self, triangle: Tuple[Tuple[str, str], Tuple[str, str], Tuple[str, str]]) -> Arbitrage or None:
+    def _walk_sell_buy_sell(self, bids_yz: list, asks_xz: list, bids_xy: list) -> tuple or None:
         """
-        Looks for arbitrage in the triangle: Y/Z, X/Z, X/Y.
+        Goes deep into the orderbooks while selling Y/Z, buying X/Z, selling X/Y is profitable.
 
-        X, Y, Z are three currencies for which exist the three currency pairs above
+        The orderbooks are not modified, we keep a cursor on the current level of each one
+        and count how much of that level's amount is already used.
 
-        :param triangle: ((Y, Z), (X, Z), (X, Y)) example: (('ETH', 'BTC'), ('EOS', 'BTC'), ('EOS', 'ETH'))
-        :return: Arbitrage instance or None
+        :param bids_yz: [(price, amount), ...] bids on Y/Z
+        :param asks_xz: [(price, amount), ...] asks on X/Z
+        :param bids_xy: [(price, amount), ...] bids on X/Y
+        :return: (amounts: dict, prices: (YZ, XZ, XY), depth: int) or None if not profitable even on the top
         """
-        yz = self._exchange.make_symbol(triangle[0][0], triangle[0][1])
-        xz = self._exchange.make_symbol(triangle[1][0], triangle[1][1])
-        xy = self._exchange.make_symbol(triangle[2][0], triangle[2][1])
-        currency_z = triangle[0][1]
-        currency_x = triangle[1][0]
-        currency_y = triangle[0][0]
-        # initializing existing_arbitrages storage
-        pairs = '{} {} {}'.format(yz, xz, xy)
-        if pairs not in self._existing_arbitrages:
-            self._existing_arbitrages[pairs] = {}
-        for actions in ['sell buy sell', 'buy sell buy']:
-            if actions not in self._existing_arbitrages[pairs]:
-                self._existing_arbitrages[pairs][actions] = 0
-        # getting orderbooks
-        for symbol in [yz, xz, xy]:
-            if not self._orderbooks[symbol].is_valid():
-                    # logger.debug('Orderbooks are not valid right now')
-                    return None
-        bids = {
-            'yz': self._orderbooks[yz].get_bids(),
-            'xz': self._orderbooks[xz].get_bids(),
-            'xy': self._orderbooks[xy].get_bids()
-        }
-        asks = {
-            'yz': self._orderbooks[yz].get_asks(),
-            'xz': self._orderbooks[xz].get_asks(),
-            'xy': self._orderbooks[xy].get_asks()
+        fee_complement = self._fee_complement
+        fee_complement_cubed = self._fee_complement_cubed
+        min_profit = self._min_profit
+        amount_x_buy_total = Decimal(0)
+        amount_x_sell_total = Decimal(0)
+        amount_y_total = Decimal(0)
+        amount_z_spend_total = Decimal(0)
+        profit_z_total = Decimal(0)
+        prices = None
+        depth = 0
+        i_yz = i_xz = i_xy = 0
+        used_yz = used_xz = used_xy = Decimal(0)
+        while 1:
+            try:
+                price_yz, level_yz = bids_yz[i_yz]
+                price_xz, level_xz = asks_xz[i_xz]
+                price_xy, level_xy = bids_xy[i_xy]
+            except IndexError:
+                # orderbook is too short
+                break
+            # check profitability
+            if price_yz / price_xz * price_xy * fee_complement_cubed - 1 < min_profit:
+                break
+            # calculate trade amounts available on this level
+            left_yz = level_yz - used_yz
+            left_xz = level_xz - used_xz
+            left_xy = level_xy - used_xy
+            amount_x_sell = min(left_xz, left_xy)  # this much we can sell for sure
+            amount_x_buy = amount_x_sell / fee_complement  # plus the fee, that's how much X we must buy
+            if amount_x_buy > left_xz:  # if we can't buy enough X on X/Z
+                amount_x_buy = left_xz  # then we buy as much X as we can on X/Z
+                amount_x_sell = amount_x_buy * fee_complement  # => minus the fee, that's how much X we can sell on X/Y
+            amount_y = amount_x_sell * price_xy * fee_complement  # Y we get from selling X, that we can sell on Y/Z
+            if amount_y > left_yz:  # if we can't sell that much Y on Y/Z
+                amount_y = left_yz  # then sell as much Y as we can on Y/Z
+                amount_x_sell = amount_y / price_xy / fee_complement  # this much X we must sell on X/Y to have enough Y
+                amount_x_buy = amount_x_sell / fee_complement  # plus the fee, this much X we must buy on X/Z
+            # save the counted amounts and price levels
+            amount_z_spend = amount_x_buy * price_xz
+            amount_x_buy_total += amount_x_buy
+            amount_x_sell_total += amount_x_sell
+            amount_y_total += amount_y
+            amount_z_spend_total += amount_z_spend
+            profit_z_total += amount_y * price_yz * fee_complement - amount_z_spend
+            prices = (price_yz, price_xz, price_xy)
+            # mark the counted amounts as used and try to go deeper on the next iteration,
+            # Decimal rounding may overshoot the level by a digit, that still means the level is used up
+            used_yz = min(used_yz + amount_y, level_yz)
+            used_xz = min(used_xz + amount_x_buy, level_xz)
+            used_xy = min(used_xy + amount_x_sell, level_xy)
+            if used_yz == level_yz:
+                i_yz += 1
+                used_yz = Decimal(0)
+            if used_xz == level_xz:
+                i_xz += 1
+                used_xz = Decimal(0)
+            if used_xy == level_xy:
+                i_xy += 1
+                used_xy = Decimal(0)
+            depth += 1
+        if prices is None:
+            return None
+        amounts = {
+            'y': amount_y_total,
+            'x_buy': amount_x_buy_total,
+            'x_sell': amount_x_sell_total,
+            'z_spend': amount_z_spend_total,
+            'z_profit': profit_z_total
         }
-        bids_saved = {'yz': bids['yz'].copy(), 'xz': bids['xz'].copy(), 'xy': bids['xy'].copy()}
-        asks_saved = {'yz': asks['yz'].copy(), 'xz': asks['xz'].copy(), 'xy': asks['xy'].copy()}
-        # checking that orderbooks are not empty
-        for side in [bids, asks]:
-            for pair in side:
-                if not side[pair]:
-                    # logger.debug('Orderbooks are empty (not ready yet?)')
-                    return None
+        return amounts, prices, depth
 
-        arb_found = {
-            'sell buy sell': False,
-            'buy sell buy': False
-        }
+    def _walk_buy_sell_buy(self, asks_yz: list, bids_xz: list, asks_xy: list) -> tuple or None:
+        """
+        Goes deep into the orderbooks while buying Y/Z, selling X/Z, buying X/Y is profitable.
 
-        # checking triangle in one direction: sell Y/Z, buy X/Z, sell X/Y
+        Same as _walk_sell_buy_sell() but in another direction.
+
+        :param asks_yz: [(price, amount), ...] asks on Y/Z
+        :param bids_xz: [(price, amount), ...] bids on X/Z
+        :param asks_xy: [(price, amount), ...] asks on X/Y
+        :return: (amounts: dict, prices: (YZ, XZ, XY), depth: int) or None if not profitable even on the top
+        """
+        fee_complement = self._fee_complement
+        fee_complement_cubed = self._fee_complement_cubed
+        min_profit = self._min_profit
         amount_x_buy_total = Decimal(0)
         amount_x_sell_total = Decimal(0)
         amount_y_total = Decimal(0)
         amount_z_spend_total = Decimal(0)
         profit_z_total = Decimal(0)
         prices = None
-        arb_depth = 0
+        depth = 0
+        i_yz = i_xz = i_xy = 0
+        used_yz = used_xz = used_xy = Decimal(0)
         while 1:
-            # check profitability
             try:
-                profit_rel = bids['yz'][0][0] / asks['xz'][0][0] * bids['xy'][0][0] * (1 - self._fee) ** 3 - 1
+                price_yz, level_yz = asks_yz[i_yz]
+                price_xz, level_xz = bids_xz[i_xz]
+                price_xy, level_xy = asks_xy[i_xy]
             except IndexError:
                 # orderbook is too short
                 break
-            if profit_rel < self._min_profit:
+            # check profitability
+            if price_xz / price_xy / price_yz * fee_complement_cubed - 1 < min_profit:
                 break
             # calculate trade amounts available on this level
-            amount_y, amount_x_buy, amount_x_sell = self._calculate_amounts_on_price_level(
-                'sell buy sell', bids['yz'][0], asks['xz'][0], bids['xy'][0]
-            )
-            # calculate the profit on this level
-            profit_z = amount_y * bids['yz'][0][0] * (1 - self._fee) - amount_x_buy * asks['xz'][0][0]
+            left_yz = level_yz - used_yz
+            left_xz = level_xz - used_xz
+            left_xy = level_xy - used_xy
+            amount_x_sell = min(left_xz, left_xy)  # this much we can sell for sure
+            amount_x_buy = amount_x_sell / fee_complement  # plus the fee, that's how much X we must buy
+            if amount_x_buy > left_xy:  # if we can't buy enough X on X/Y
+                amount_x_buy = left_xy  # then buy as much X as we can on X/Y
+                amount_x_sell = amount_x_buy * fee_complement  # => minus the fee, that's how much X we can sell on X/Z
+            amount_y = amount_x_buy * price_xy / fee_complement  # Y we spend to buy X, plus the fee, we must buy on Y/Z
+            if amount_y > left_yz:  # if we can't buy that much Y on Y/Z
+                amount_y = left_yz  # then buy as much Y as we can on Y/Z
+                amount_x_buy = amount_y * fee_complement / price_xy  # this much X we must buy on X/Y to spend our Y
+                amount_x_sell = amount_x_buy * fee_complement  # minus the fee, this much X we can sell
             # save the counted amounts and price levels
+            amount_z_spend = amount_y * price_yz
             amount_x_buy_total += amount_x_buy
             amount_x_sell_total += amount_x_sell
             amount_y_total += amount_y
-            amount_z_spend_total += amount_x_buy * asks['xz'][0][0]
-            profit_z_total += profit_z
-            prices = {'yz': bids['yz'][0][0], 'xz': asks['xz'][0][0], 'xy': bids['xy'][0][0]}
-            # subtract the counted amounts from the orderbooks and try to go deeper on the next iteration
-            bids['yz'][0] = (bids['yz'][0][0], bids['yz'][0][1] - amount_y)
-            asks['xz'][0] = (asks['xz'][0][0], asks['xz'][0][1] - amount_x_buy)
-            bids['xy'][0] = (bids['xy'][0][0], bids['xy'][0][1] - amount_x_sell)
-            for ob in [bids['yz'], asks['xz'], bids['xy']]:
-                if ob[0][1] < 0:
-                    raise Exception('Critical calculation error')
-                if not ob[0][1]:
-                    del ob[0]
-            arb_depth += 1
-        if prices is not None:  # potential arbitrage exists
-            orderbooks = (bids_saved['yz'], asks_saved['xz'], bids_saved['xy'])
+            amount_z_spend_total += amount_z_spend
+            profit_z_total += amount_x_sell * price_xz * fee_complement - amount_z_spend
+            prices = (price_yz, price_xz, price_xy)
+            # mark the counted amounts as used and try to go deeper on the next iteration,
+            # Decimal rounding may overshoot the level by a digit, that still means the level is used up
+            used_yz = min(used_yz + amount_y, level_yz)
+            used_xz = min(used_xz + amount_x_sell, level_xz)
+            used_xy = min(used_xy + amount_x_buy, level_xy)
+            if used_yz == level_yz:
+                i_yz += 1
+                used_yz = Decimal(0)
+            if used_xz == level_xz:
+                i_xz += 1
+                used_xz = Decimal(0)
+            if used_xy == level_xy:
+                i_xy += 1
+                used_xy = Decimal(0)
+            depth += 1
+        if prices is None:
+            return None
+        amounts = {
+            'y': amount_y_total,
+            'x_buy': amount_x_buy_total,
+            'x_sell': amount_x_sell_total,
+            'z_spend': amount_z_spend_total,
+            'z_profit': profit_z_total
+        }
+        return amounts, prices, depth
+
+    def _find_arbitrage_in_triangle(self, triangle: Tuple[Tuple[str, str], Tuple[str, str], Tuple[str, str]],
+                                    now: int) -> Arbitrage or None:
+        """
+        Looks for arbitrage in the triangle: Y/Z, X/Z, X/Y.
+
+        X, Y, Z are three currencies for which exist the three currency pairs above
+
+        :param triangle: ((Y, Z), (X, Z), (X, Y)) example: (('ETH', 'BTC'), ('EOS', 'BTC'), ('EOS', 'ETH'))
+        :param now: millisecond-timestamp of the orderbook update being checked
+        :return: Arbitrage instance or None
+        """
+        triangle_id, symbols, pairs = self._triangle_info[triangle]
+        yz, xz, xy = symbols
+        currency_z = triangle[0][1]
+        currency_x = triangle[1][0]
+        currency_y = triangle[0][0]
+        arb_key = triangle_id * 2
+        # getting orderbooks
+        orderbook_yz = self._orderbooks[yz]
+        orderbook_xz = self._orderbooks[xz]
+        orderbook_xy = self._orderbooks[xy]
+        if not (orderbook_yz.is_valid() and orderbook_xz.is_valid() and orderbook_xy.is_valid()):
+            # logger.debug('Orderbooks are not valid right now')
+            return None
+        # quick check on the top of the orderbooks: no need to go deeper if it's not profitable even there
+        try:
+            bid_yz = orderbook_yz.get_best_bid()
+            ask_yz = orderbook_yz.get_best_ask()
+            bid_xz = orderbook_xz.get_best_bid()
+            ask_xz = orderbook_xz.get_best_ask()
+            bid_xy = orderbook_xy.get_best_bid()
+            ask_xy = orderbook_xy.get_best_ask()
+        except BaseOrderbook.Error:
+            # logger.debug('Orderbooks are empty (not ready yet?)')
+            return None
+        if (bid_yz / ask_xz * bid_xy * self._fee_complement_cubed - 1 < self._min_profit and
+                bid_xz / ask_xy / ask_yz * self._fee_complement_cubed - 1 < self._min_profit):
+            self._forget_disappeared_arbitrages(arb_key, [False, False], pairs)
+            return None
+        bids_yz = orderbook_yz.get_bids()
+        bids_xz = orderbook_xz.get_bids()
+        bids_xy = orderbook_xy.get_bids()
+        asks_yz = orderbook_yz.get_asks()
+        asks_xz = orderbook_xz.get_asks()
+        asks_xy = orderbook_xy.get_asks()
+        # checking that orderbooks are not empty
+        if not (bids_yz and bids_xz and bids_xy and asks_yz and asks_xz and asks_xy):
+            # logger.debug('Orderbooks are empty (not ready yet?)')
+            return None
+
+        arb_found = [False, False]  # per direction bit
+
+        # checking triangle in one direction: sell Y/Z, buy X/Z, sell X/Y
+        walked = self._walk_sell_buy_sell(bids_yz, asks_xz, bids_xy)
+        if walked is not None:  # potential arbitrage exists
+            amounts, prices, arb_depth = walked
+            orderbooks = (bids_yz, asks_xz, bids_xy)
             # make amounts comply with order size requirements
-            amounts = {
-                'y': amount_y_total,
-                'x_buy': amount_x_buy_total,
-                'x_sell': amount_x_sell_total,
-                'z_spend': amount_z_spend_total,
-                'z_profit': profit_z_total
-            }
             # logger.debug(f'Amounts before recalculation: {amounts}')
             amounts = self._limit_amounts(amounts, self._reduce_factor)
             # logger.debug(f'Amounts limited: {amounts}')
             normalized = self._normalize_amounts_and_recalculate(
-                symbols=(yz, xz, xy),
+                symbols=symbols,
                 direction='sell buy sell',
                 amounts=amounts,
-                prices=(prices['yz'], prices['xz'], prices['xy']),
+                prices=prices,
                 orderbooks=orderbooks
             )
             # logger.debug(f'Amounts normalized and recalculated: {normalized}')
             if normalized is not None:  # if arbitrage still exists after normalization & recalculation
-                now = int(time.time()*1000)
-                if self._existing_arbitrages[pairs]['sell buy sell'] == 0:
-                    self._existing_arbitrages[pairs]['sell buy sell'] = now
-                arb_found['sell buy sell'] = True
-                if now - self._existing_arbitrages[pairs]['sell buy sell'] >= self._min_age and arb_depth >= self._min_depth:
+                found_at = self._existing_arbitrages.setdefault(arb_key, now)
+                arb_found[0] = True
+                if now - found_at >= self._min_age and arb_depth >= self._min_depth:
                     return Arbitrage(
                         actions=[
-                            MarketAction(triangle[0], 'sell', prices['yz'], normalized['y']),
-                            MarketAction(triangle[1], 'buy', prices['xz'], normalized['x_buy']),
-                            MarketAction(triangle[2], 'sell', prices['xy'], normalized['x_sell'])
+                            MarketAction(triangle[0], 'sell', prices[0], normalized['y']),
+                            MarketAction(triangle[1], 'buy', prices[1], normalized['x_buy']),
+                            MarketAction(triangle[2], 'sell', prices[2], normalized['x_sell'])
                         ],
                         currency_z=currency_z,
                         amount_z=normalized['z_spend'],
@@ -608,81 +703,35 @@ class ArbitrageDetector:
                         profit_x=normalized['x_profit'],
                         currency_x=currency_x,
                         orderbooks=orderbooks,
-                        ts=int(time.time() * 1000)
+                        ts=now
                     )
 
         # checking triangle in another direction: buy Y/Z, sell X/Z, buy X/Y
-        amount_x_buy_total = Decimal(0)
-        amount_x_sell_total = Decimal(0)
-        amount_y_total = Decimal(0)
-        amount_z_spend_total = Decimal(0)
-        profit_z_total = Decimal(0)
-        prices = None
-        arb_depth = 0
-        while 1:
-            # check profitability
-            try:
-                profit_rel = bids['xz'][0][0] / asks['xy'][0][0] / asks['yz'][0][0] * (1 - self._fee) ** 3 - 1
-            except IndexError:
-                # orderbook is too short
-                break
-            if profit_rel < self._min_profit:
-                break
-            # calculate trade amounts available on this level
-            amount_y, amount_x_buy, amount_x_sell = self._calculate_amounts_on_price_level(
-                'buy sell buy', asks['yz'][0], bids['xz'][0], asks['xy'][0]
-            )
-            # calculate the profit on this level
-            profit_z = amount_x_sell * bids['xz'][0][0] * (1 - self._fee) - amount_y * asks['yz'][0][0]
-            # save the counted amounts and price levels
-            amount_x_buy_total += amount_x_buy
-            amount_x_sell_total += amount_x_sell
-            amount_y_total += amount_y
-            amount_z_spend_total += amount_y * asks['yz'][0][0]
-            profit_z_total += profit_z
-            prices = {'yz': asks['yz'][0][0], 'xz': bids['xz'][0][0], 'xy': asks['xy'][0][0]}
-            # subtract the counted amounts from the orderbooks and try to go deeper on the next iteration
-            asks['yz'][0] = (asks['yz'][0][0], asks['yz'][0][1] - amount_y)
-            bids['xz'][0] = (bids['xz'][0][0], bids['xz'][0][1] - amount_x_sell)
-            asks['xy'][0] = (asks['xy'][0][0], asks['xy'][0][1] - amount_x_buy)
-            for ob in [asks['yz'], bids['xz'], asks['xy']]:
-                if ob[0][1] < 0:
-                    raise Exception('Critical calculation error')
-                if not ob[0][1]:
-                    del ob[0]
-            arb_depth += 1
-        if prices is not None:  # potential arbitrage exists
-            orderbooks = (asks_saved['yz'], bids_saved['xz'], asks_saved['xy'])
+        walked = self._walk_buy_sell_buy(asks_yz, bids_xz, asks_xy)
+        if walked is not None:  # potential arbitrage exists
+            amounts, prices, arb_depth = walked
+            orderbooks = (asks_yz, bids_xz, asks_xy)
             # make amounts comply with order size requirements
-            amounts = {
-                'y': amount_y_total,
-                'x_buy': amount_x_buy_total,
-                'x_sell': amount_x_sell_total,
-                'z_spend': amount_z_spend_total,
-                'z_profit': profit_z_total
-            }
             # logger.debug(f'Amounts before recalculation: {amounts}')
             amounts = self._limit_amounts(amounts, self._reduce_factor)
             # logger.debug(f'Amounts limited: {amounts}')
             normalized = self._normalize_amounts_and_recalculate(
-                symbols=(yz, xz, xy),
+                symbols=symbols,
                 direction='buy sell buy',
                 amounts=amounts,
-                prices=(prices['yz'], prices['xz'], prices['xy']),
+                prices=prices,
                 orderbooks=orderbooks
             )
             # logger.debug(f'Amounts normalized and recalculated: {normalized}')
             if normalized is not None:  # if arbitrage still exists after normalization & recalculation
-                now = int(time.time()*1000)
-                if self._existing_arbitrages[pairs]['buy sell buy'] == 0:
-                    self._existing_arbitrages[pairs]['buy sell buy'] = now
-                arb_found['buy sell buy'] = True
-                if now - self._existing_arbitrages[pairs]['buy sell buy'] >= self._min_age and arb_depth >= self._min_depth:
+                found_at = self._existing_arbitrages.setdefault(arb_key + 1, now)
+                arb_found[1] = True
+                if now - found_at >= self._min_age and arb_depth >= self._min_depth:
                     return Arbitrage(
                         actions=[
-                            MarketAction(triangle[0], 'buy', prices['yz'], normalized['y']),
-                            MarketAction(triangle[1], 'sell', prices['xz'], normalized['x_sell']),
-                            MarketAction(triangle[2], 'buy', prices['xy'], normalized['x_buy'])
+                            MarketAction(triangle[0], 'buy', prices[0], normalized['y']),
+                            MarketAction(triangle[1], 'sell', prices[1], normalized['x_sell']),
+                            MarketAction(triangle[2], 'buy', prices[2], normalized['x_buy'])
                         ],
                         currency_z=currency_z,
                         amount_z=normalized['z_spend'],
@@ -693,30 +742,37 @@ class ArbitrageDetector:
                         profit_x=normalized['x_profit'],
                         currency_x=currency_x,
                         orderbooks=orderbooks,
-                        ts=int(time.time() * 1000)
+                        ts=now
                     )
 
         # no arbitrage found
         # logger.info(f'No arbitrage found in {triangle}')
-        for actions in ['sell buy sell', 'buy sell buy']:
-            if not arb_found[actions] and self._existing_arbitrages[pairs][actions] > 0:
-                self._existing_arbitrages[pairs][actions] = 0
-                dispatcher.send(signal='arbitrage_disappeared', sender=self, pairs=pairs, actions=actions)
+        self._forget_disappeared_arbitrages(arb_key, arb_found, pairs)
         return None
 
+    def _forget_disappeared_arbitrages(self, arb_key: int, arb_found: List[bool], pairs: str):
+        """
+        Resets existing arbitrages that were not found this time and reports their disappearance.
+
+        :param arb_key: existing arbitrages key of the triangle (triangle_id * 2)
+        :param arb_found: [bool, bool] whether arbitrage was found, per direction bit
+        :param pairs: 'YZ XZ XY' symbols of the triangle
+        """
+        for direction, actions in enumerate(DIRECTIONS):
+            key = arb_key + direction
+            if not arb_found[direction] and self._existing_arbitrages.pop(key, None) is not None:
+                dispatcher.send(signal='arbitrage_disappeared', sender=self, pairs=pairs, actions=actions)
+
     def _on_orderbook_changed(self, sender, symbol: str):
-        try:
-            triangles = self._symbols[symbol]['triangles']
-        except KeyError:
-            if symbol in self._symbols:
-                logger.warning(f'Triangles missing for symbol {symbol}: {self._symbols[symbol]}')
-            else:
-                logger.warning(f'Symbol unknown: {symbol}')
-        else:
-            for triangle in triangles:
-                arbitrage = self._find_arbitrage_in_triangle(triangle)
-                if arbitrage is not None:
-                    self._report_arbitrage(arbitrage)
+        triangles = self._symbol_triangles.get(symbol)
+        if triangles is None:
+            logger.warning(f'Symbol unknown: {symbol}')
+            return
+        now = time.time_ns() // 1000000
+        for triangle in triangles:
+            arbitrage = self._find_arbitrage_in_triangle(triangle, now)
+            if arbitrage is not None:
+                self._report_arbitrage(arbitrage)
 
 
 def test_on_arbitrage_detected(sender: ArbitrageDetector, arb: Arbitrage):
@@ -1,4 +1,5 @@
 import peewee as pw
+from concurrent.futures import ThreadPoolExecutor
 from config import config
 from logger import get_logger
 logger = get_logger(__name__)
@@ -13,6 +14,9 @@ db = pw.MySQLDatabase(
     charset='utf8mb4'
 )
 
+# all the writes go through this single thread, so that the event loop never waits for MySQL
+db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='DBWriter')
+
 
 class BaseModel(pw.Model):
     class Meta:
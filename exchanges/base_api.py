@@ -1,9 +1,64 @@
 import asyncio
+import random
 import time
 from logger import get_logger
 logger = get_logger(__name__)
 
 
+class RateLimiter:
+    """Token bucket: lets through bursts of up to <burst> requests, refilling at <rate> requests per second"""
+
+    def __init__(self, rate: float, burst: int):
+        self._rate = rate
+        self._burst = burst
+        self._tokens = burst
+        self._last_ts = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self._burst, self._tokens + (now - self._last_ts) * self._rate)
+                self._last_ts = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+
+    def drain(self):
+        # the exchange says we are over the limit, so start over from an empty bucket
+        self._tokens = 0
+        self._last_ts = time.monotonic()
+
+
+class CircuitBreaker:
+    """Opens after <threshold> consecutive failed calls, stays open for <cooldown> seconds after the last one"""
+
+    def __init__(self, threshold: int, cooldown: float):
+        self._threshold = threshold
+        self._cooldown = cooldown
+        self._failures = 0
+        self._opened_ts = None
+
+    def is_open(self) -> bool:
+        return self._opened_ts is not None and time.monotonic() - self._opened_ts < self._cooldown
+
+    def record_success(self):
+        if self._opened_ts is not None:
+            logger.info('Circuit breaker closed')
+        self._failures = 0
+        self._opened_ts = None
+
+    def record_failure(self):
+        # once over the threshold, each next failure keeps it open until a call succeeds
+        self._failures += 1
+        if self._failures >= self._threshold:
+            if self._opened_ts is None:
+                logger.warning(f'Circuit breaker opened after {self._failures} failed calls')
+            self._opened_ts = time.monotonic()
+
+
 class BaseAPI:
 
     class Error(BaseException):
@@ -16,28 +71,54 @@ class BaseAPI:
     class OrderNotFound(ErrorNoRetry):
         pass
 
+    class Unavailable(ErrorNoRetry):
+        pass
+
+    class TooManyRequests(Error):
+        def __init__(self, message: str = '', retry_after: float = None):
+            super().__init__(message)
+            self.retry_after = retry_after  # seconds to wait before retrying, if the exchange says so
+
     class Stopping(BaseException):
         pass
 
-    def __init__(self):
+    def __init__(self, parallel_calls: int = 1):
         self._stopping = False
         self._last_request_ts = 0
+        # up to <parallel_calls> requests at a time, more urgent ones take free slots first
+        self._parallel_calls = parallel_calls
         self._priority_locks = {
-            0: asyncio.Lock(),
-            1: asyncio.Lock(),
-            2: asyncio.Lock()
+            0: asyncio.Semaphore(parallel_calls),
+            1: asyncio.Semaphore(parallel_calls),
+            2: asyncio.Semaphore(parallel_calls)
         }
         self._request_interval = 1      # seconds
+        self._rate_limiter = None       # RateLimiter, if the exchange has a request rate limit to keep to
+        self._circuit_breaker = None    # CircuitBreaker, to skip new arbitrages while the exchange is down
+        self._retry_delay_min = 0.05    # seconds, delay before the first retry, doubles with each next one
+        self._retry_delay_max = 1       # seconds
+        self._retry_jitter = 0.5        # up to this share of the delay is added randomly
         self._calls_active = {0: 0, 1: 0, 2: 0}
 
-    async def _safe_call(self, urgency: int, func, *args, **kwargs):
-        # prioritizes, throttles, retries on error
+    async def _safe_call(self, urgency: int, func, *args, background: bool = False, **kwargs):
+        # prioritizes, throttles, retries on error with exponential backoff
+        # the circuit breaker never blocks a call, it only counts calls that failed after all the retries,
+        # unless it's a background call (keepalive etc.), whose failures should not stop trading
+        breaker = None if background else self._circuit_breaker
         tries = 10
+        retry_delay = self._retry_delay_min
         try:
             while not self._stopping:
                 try:
-                    return await self._prioritize(urgency, self._throttle, func, *args, **kwargs)
+                    r = await self._prioritize(urgency, self._throttle, func, *args, **kwargs)
+                except BaseAPI.Unavailable:
+                    if breaker is not None:
+                        breaker.record_failure()
+                    raise
                 except BaseAPI.ErrorNoRetry:
+                    # the exchange has responded, so it is up
+                    if breaker is not None:
+                        breaker.record_success()
                     raise
                 except BaseAPI.Stopping:
                     raise
@@ -45,10 +126,23 @@ class BaseAPI:
                     logger.warning(f'API call failed: {args} {kwargs}. Reason: {e}')
                     tries -= 1
                     if tries > 0:
-                        await asyncio.sleep(0.5)
+                        # random jitter keeps parallel calls from retrying all at once
+                        delay = retry_delay * (1 + random.uniform(0, self._retry_jitter))
+                        if isinstance(e, BaseAPI.TooManyRequests):
+                            if self._rate_limiter is not None:
+                                self._rate_limiter.drain()
+                            if e.retry_after is not None:
+                                delay = max(delay, e.retry_after)
+                        await asyncio.sleep(delay)
+                        retry_delay = min(retry_delay * 2, self._retry_delay_max)
                         continue
                     else:
+                        if breaker is not None:
+                            breaker.record_failure()
                         raise
+                if breaker is not None:
+                    breaker.record_success()
+                return r
         except BaseAPI.ErrorNoRetry:
             raise
         except BaseAPI.Stopping:
@@ -56,6 +150,9 @@ class BaseAPI:
         except (asyncio.TimeoutError, BaseAPI.Error):
             raise BaseAPI.Error('Failed 10 times')
 
+    def is_available(self) -> bool:
+        return self._circuit_breaker is None or not self._circuit_breaker.is_open()
+
     async def _prioritize(self, urgency: int, func, *args, **kwargs):
         self._calls_active[urgency] += 1
         if self._calls_active[urgency] >= 10:
@@ -82,6 +179,8 @@ class BaseAPI:
         passed = time.time() - self._last_request_ts
         if passed < self._request_interval:
             await asyncio.sleep(self._request_interval - passed)
+        if self._rate_limiter is not None:
+            await self._rate_limiter.acquire()
         r = await func(*args, **kwargs)
         self._last_request_ts = time.time()
         return r
@@ -90,4 +189,5 @@ class BaseAPI:
         self._stopping = True
         # all locks acquired means all requests are completed
         for level, lock in self._priority_locks.items():
-            await lock.acquire()
+            for i in range(self._parallel_calls):
+                await lock.acquire()
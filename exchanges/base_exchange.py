@@ -1,3 +1,4 @@
+import asyncio
 from decimal import Decimal
 from typing import Dict, Tuple
 from .base_orderbook import BaseOrderbook
@@ -73,6 +74,14 @@ class BaseExchange:
         # must return BaseExchange.OrderResult or raise BaseExchange.Error
         raise BaseExchange.Error('Not implemented')
 
+    async def wait_order_update(self, symbol: str, order_id: str, timeout: float):
+        # returns as soon as the order has probably changed, or after <timeout> seconds otherwise
+        await asyncio.sleep(timeout)
+
+    def is_available(self) -> bool:
+        # False while the exchange is known to be down and API calls would fail anyway
+        return True
+
     async def measure_ping(self) -> Tuple[int, int, int]:
         # must return min, max, avg ping in milliseconds or raise BaseExchange.Error
         raise BaseExchange.Error('Not implemented')
@@ -62,6 +62,17 @@ class BaseOrderbook:
         except IndexError:
             raise BaseOrderbook.Error('Asks are empty')
 
+    def get_bids_volume_above(self, price: Decimal) -> Decimal:
+        # bids prices are sorted descending, so everything above the price is in front of its position
+        end = self._bids_prices.bisect_left(price)
+        bids = self._bids
+        return sum((bids.get(p, 0) for p in self._bids_prices.islice(0, end)), Decimal(0))
+
+    def get_asks_volume_below(self, price: Decimal) -> Decimal:
+        end = self._asks_prices.bisect_left(price)
+        asks = self._asks
+        return sum((asks.get(p, 0) for p in self._asks_prices.islice(0, end)), Decimal(0))
+
     def stop(self):
         # graceful stop, if needed
         return
@@ -4,6 +4,7 @@ import aiohttp
 import asyncio
 import hashlib
 import hmac
+import orjson
 import requests
 import time
 from abc import ABC, abstractmethod
@@ -91,6 +92,8 @@ class BaseClient(ABC):
 
         self.API_KEY = api_key
         self.API_SECRET = api_secret
+        # keyed once, each signature starts from a copy of it
+        self._hmac = hmac.new((api_secret or '').encode('utf-8'), digestmod=hashlib.sha256)
         self.session = self._init_session()
         self._requests_params = requests_params
 
@@ -119,7 +122,8 @@ class BaseClient(ABC):
 
         ordered_data = self._order_params(data)
         query_string = '&'.join(["{}={}".format(d[0], d[1]) for d in ordered_data])
-        m = hmac.new(self.API_SECRET.encode('utf-8'), query_string.encode('utf-8'), hashlib.sha256)
+        m = self._hmac.copy()
+        m.update(query_string.encode('utf-8'))
         return m.hexdigest()
 
     @staticmethod
@@ -2096,7 +2100,14 @@ class AsyncClient(BaseClient):
     def _init_session(self):
 
         loop = asyncio.get_event_loop()
+        # keep connections to the API open between requests, so that orders don't wait for a new TLS handshake
+        connector = aiohttp.TCPConnector(
+            limit=16,
+            keepalive_timeout=60,
+            ttl_dns_cache=300
+        )
         session = aiohttp.ClientSession(
+            connector=connector,
             loop=loop,
             headers=self._get_headers()
         )
@@ -2117,7 +2128,7 @@ class AsyncClient(BaseClient):
         if not str(response.status).startswith('2'):
             raise BinanceAPIException(response, response.status, await response.text())
         try:
-            return await response.json()
+            return orjson.loads(await response.read())
         except ValueError:
             txt = await response.text()
             raise BinanceRequestException('Invalid Response: {}'.format(txt))
@@ -1,7 +1,8 @@
 import time
+import uuid
 import asyncio
 from typing import List, Tuple
-from exchanges.base_api import BaseAPI
+from exchanges.base_api import BaseAPI, RateLimiter, CircuitBreaker
 from .binance.client import AsyncClient
 from .binance.exceptions import BinanceAPIException
 from logger import get_logger
@@ -10,15 +11,41 @@ logger = get_logger(__name__)
 
 class BinanceAPI(BaseAPI):
 
+    # error codes on which retrying is useless: bad credentials, bad parameters, order rejected by the exchange
+    UNRECOVERABLE_ERROR_CODES = {
+        -1002, -1013, -1022,
+        -1100, -1101, -1102, -1103, -1104, -1105, -1106,
+        -1111, -1112, -1114, -1115, -1116, -1117, -1121, -1125,
+        -2010, -2014, -2015
+    }
+
     def __init__(self, client: AsyncClient):
-        super().__init__()
+        super().__init__(parallel_calls=8)
         self._client = client
-        self._request_interval = 0  # because binance takes care of its rate limit automatically
+        self._request_interval = 0  # no fixed interval, the rate limiter below keeps us within binance limits
+        self._rate_limiter = RateLimiter(rate=1150/60, burst=20)    # binance allows 1200 per minute
+        self._circuit_breaker = CircuitBreaker(threshold=5, cooldown=30)
+        self._exchange_info_cache = None    # (timestamp, exchange info)
+        self._exchange_info_cache_ttl = 10 * 60     # seconds
+        self._exchange_info_lock = asyncio.Lock()
 
     @classmethod
     async def create(cls, api_key: str, api_secret: str):
         client = await AsyncClient.create(api_key, api_secret)
-        return cls(client)
+        self = cls(client)
+        # open a few connections at once, so that parallel orders don't have to wait for new ones
+        await asyncio.gather(*[self.ping() for i in range(3)])
+        return self
+
+    async def ping(self, urgency: int = 0) -> dict:
+        """
+        Проверка связи - /api/v1/ping
+
+        Вес - 1
+
+        :return: пустой словарь
+        """
+        return await self._safe_call(urgency, self._handle_errors, self._client.ping, background=True)
 
     async def time(self, urgency: int = 0) -> dict:
         """
@@ -30,15 +57,25 @@ class BinanceAPI(BaseAPI):
         """
         return await self._safe_call(urgency, self._handle_errors, self._client.get_server_time)
 
-    async def exchange_info(self, urgency: int = 0) -> dict:
+    async def exchange_info(self, urgency: int = 0, force_refresh: bool = False) -> dict:
         """
         Настройки и лимиты биржи - /api/v1/exchangeInfo
+        Ответ кэшируется на 10 минут.
 
         Вес - 1
 
+        :param force_refresh: запросить заново, даже если в кэше есть свежий ответ
         :return: структура данных в словаре
         """
-        return await self._safe_call(urgency, self._handle_errors, self._client.get_exchange_info)
+        # one request at a time, those waiting get the result of the previous one from the cache
+        async with self._exchange_info_lock:
+            cached = self._exchange_info_cache
+            if cached is not None and not force_refresh:
+                if time.monotonic() - cached[0] < self._exchange_info_cache_ttl:
+                    return cached[1]
+            info = await self._safe_call(urgency, self._handle_errors, self._client.get_exchange_info)
+            self._exchange_info_cache = (time.monotonic(), info)
+            return info
 
     async def depth(self, symbol: str, limit: int = 100, urgency: int = 0) -> dict:
         """
@@ -93,7 +130,8 @@ class BinanceAPI(BaseAPI):
                         либо не будет куплено вообще ничего, ордер отменится.
                 :param price: цена
                 :param new_client_order_id: Идентификатор ордера, который вы сами придумаете (строка).
-                    Если не указан, генерится автоматически.
+                    Если не указан, генерится автоматически (uuid4) на нашей стороне, чтобы повтор запроса
+                    при ошибке не создал второй ордер: перед повтором ордер ищется по этому идентификатору.
                 :param stop_price: стоп-цена, можно указывать если тип ордера STOP_LOSS, STOP_LOSS_LIMIT, TAKE_PROFIT
                     или TAKE_PROFIT_LIMIT.
                 :param iceberg_qty: кол-во для ордера-айсберга, можно указывать, если тип ордера LIMIT, STOP_LOSS_LIMIT
@@ -128,27 +166,56 @@ class BinanceAPI(BaseAPI):
 
         :return: при создании ордера вернется словарь, содержимое которого зависит от newOrderRespType
         """
-        kwargs = {
-            'symbol': symbol.upper(),
-            'side': side.upper(),
-            'type': order_type.upper(),
-            'quantity': quantity
-        }
-        if order_type.upper() != 'MARKET':
-            kwargs['timeInForce'] = time_in_force if time_in_force is not None else 'GTC'
-        if price:
-            kwargs['price'] = price
-        if new_client_order_id:
-            kwargs['newClientOrderId'] = new_client_order_id
-        if stop_price:
-            kwargs['stopPrice'] = stop_price
-        if iceberg_qty:
-            kwargs['icebergQty'] = iceberg_qty
-        if recv_window:
-            kwargs['recvWindow'] = recv_window
-        if new_order_resp_type:
-            kwargs['newOrderRespType'] = new_order_resp_type
-        return await self._safe_call(urgency, self._handle_errors, self._client.create_order, **kwargs)
+        kwargs = self._order_kwargs(
+            symbol, side, order_type, quantity,
+            timeInForce=time_in_force,
+            price=price,
+            newClientOrderId=new_client_order_id,
+            stopPrice=stop_price,
+            icebergQty=iceberg_qty,
+            recvWindow=recv_window,
+            newOrderRespType=new_order_resp_type
+        )
+        if kwargs['type'] == 'MARKET':
+            kwargs.pop('timeInForce', None)
+        else:
+            kwargs.setdefault('timeInForce', 'GTC')
+        kwargs.setdefault('newClientOrderId', uuid.uuid4().hex)
+        attempted = False
+
+        async def find_order(params: dict) -> dict or None:
+            try:
+                return await self._client.get_order(
+                    symbol=params['symbol'],
+                    origClientOrderId=params['newClientOrderId']
+                )
+            except BinanceAPIException as e:
+                if e.code != -2013:     # anything but "Order does not exist"
+                    raise
+            return None
+
+        async def create_order_once(**params):
+            nonlocal attempted
+            retrying = attempted
+            if retrying:
+                # previous attempt might have placed the order and only the response got lost
+                order = await find_order(params)
+                if order is not None:
+                    return order
+            attempted = True
+            try:
+                return await self._client.create_order(**params)
+            except BinanceAPIException as e:
+                if not retrying or e.code != -2010:
+                    raise
+                # previous attempt might have still been in flight when we looked for it,
+                # then this one is rejected as a duplicate, and the order is there by now
+                order = await find_order(params)
+                if order is None:
+                    raise
+                return order
+
+        return await self._safe_call(urgency, self._handle_errors, create_order_once, **kwargs)
 
     async def test_order(self, symbol: str, side: str, order_type: str, quantity,
                          time_in_force: str = None, price=None, new_client_order_id: str = None,
@@ -190,26 +257,16 @@ class BinanceAPI(BaseAPI):
 
         :return: пустой словарь в случае успеха.
         """
-        kwargs = {
-            'symbol': symbol.upper(),
-            'side': side.upper(),
-            'type': order_type.upper(),
-            'quantity': quantity
-        }
-        if time_in_force:
-            kwargs['timeInForce'] = time_in_force
-        if price:
-            kwargs['price'] = price
-        if new_client_order_id:
-            kwargs['newClientOrderId'] = new_client_order_id
-        if stop_price:
-            kwargs['stopPrice'] = stop_price
-        if iceberg_qty:
-            kwargs['icebergQty'] = iceberg_qty
-        if recv_window:
-            kwargs['recvWindow'] = recv_window
-        if new_order_resp_type:
-            kwargs['newOrderRespType'] = new_order_resp_type
+        kwargs = self._order_kwargs(
+            symbol, side, order_type, quantity,
+            timeInForce=time_in_force,
+            price=price,
+            newClientOrderId=new_client_order_id,
+            stopPrice=stop_price,
+            icebergQty=iceberg_qty,
+            recvWindow=recv_window,
+            newOrderRespType=new_order_resp_type
+        )
         return await self._safe_call(urgency, self._handle_errors, self._client.create_test_order, **kwargs)
 
     async def order_info(self, symbol: str, order_id: int = None, orig_client_order_id: str = None,
@@ -232,13 +289,7 @@ class BinanceAPI(BaseAPI):
 
         :return: словарь.
         """
-        kwargs = {'symbol': symbol.upper()}
-        if order_id:
-            kwargs['orderId'] = order_id
-        else:
-            kwargs['origClientOrderId'] = orig_client_order_id
-        if recv_window:
-            kwargs['recvWindow'] = recv_window
+        kwargs = self._order_id_kwargs(symbol, order_id, orig_client_order_id, recvWindow=recv_window)
         return await self._safe_call(urgency, self._handle_errors, self._client.get_order, **kwargs)
 
     async def cancel_order(self, symbol: str, order_id: int = None,
@@ -263,15 +314,11 @@ class BinanceAPI(BaseAPI):
 
         :return: словарь.
         """
-        kwargs = {'symbol': symbol.upper()}
-        if order_id:
-            kwargs['orderId'] = order_id
-        else:
-            kwargs['origClientOrderId'] = orig_client_order_id
-        if recv_window:
-            kwargs['recvWindow'] = recv_window
-        if new_client_order_id:
-            kwargs['newClientOrderId'] = new_client_order_id
+        kwargs = self._order_id_kwargs(
+            symbol, order_id, orig_client_order_id,
+            recvWindow=recv_window,
+            newClientOrderId=new_client_order_id
+        )
         return await self._safe_call(urgency, self._handle_errors, self._client.cancel_order, **kwargs)
 
     async def account(self, recv_window: int = None, urgency: int = 0) -> dict:
@@ -294,7 +341,54 @@ class BinanceAPI(BaseAPI):
             kwargs['recvWindow'] = recv_window
         return await self._safe_call(urgency, self._handle_errors, self._client.get_account, **kwargs)
 
-    async def get_symbols_info(self, urgency: int = 0) -> List[dict]:
+    async def create_listen_key(self, urgency: int = 0) -> str:
+        """
+        Создание ключа для потока данных пользователя - /api/v3/userDataStream
+
+        Вес – 1
+        Метод – POST
+
+        Ключ действует 60 минут, если его не продлевать через keepalive_listen_key().
+
+        :return: listenKey, строка
+        """
+        return await self._safe_call(urgency, self._handle_errors, self._client.stream_get_listen_key, background=True)
+
+    async def keepalive_listen_key(self, listen_key: str, urgency: int = 0) -> dict:
+        """
+        Продление ключа потока данных пользователя - /api/v3/userDataStream
+
+        Вес – 1
+        Метод – PUT
+
+        Рекомендуется продлевать каждые 30 минут.
+
+        Параметры:
+            Обязательные:
+                :param listen_key: ключ потока
+        :return: пустой словарь
+        """
+        return await self._safe_call(
+            urgency, self._handle_errors, self._client.stream_keepalive, listen_key, background=True
+        )
+
+    async def close_listen_key(self, listen_key: str, urgency: int = 0) -> dict:
+        """
+        Закрытие потока данных пользователя - /api/v3/userDataStream
+
+        Вес – 1
+        Метод – DELETE
+
+        Параметры:
+            Обязательные:
+                :param listen_key: ключ потока
+        :return: пустой словарь
+        """
+        return await self._safe_call(
+            urgency, self._handle_errors, self._client.stream_close, listen_key, background=True
+        )
+
+    async def get_symbols_info(self, urgency: int = 0, force_refresh: bool = False) -> List[dict]:
         """
         :return: list of dictionaries with symbols info:
         {
@@ -333,7 +427,7 @@ class BinanceAPI(BaseAPI):
             ]
         }
         """
-        response_json = await self.exchange_info()
+        response_json = await self.exchange_info(urgency, force_refresh)
         try:
             symbols_info = response_json['symbols']
         except LookupError:
@@ -356,6 +450,29 @@ class BinanceAPI(BaseAPI):
         await self._client.get_account()
         return int((time.time() - t)*1000)
 
+    @staticmethod
+    def _order_kwargs(symbol: str, side: str, order_type: str, quantity, **optional) -> dict:
+        # optional params are only sent if given
+        kwargs = {
+            'symbol': symbol.upper(),
+            'side': side.upper(),
+            'type': order_type.upper(),
+            'quantity': quantity
+        }
+        kwargs.update((name, value) for name, value in optional.items() if value)
+        return kwargs
+
+    @staticmethod
+    def _order_id_kwargs(symbol: str, order_id: int or None, orig_client_order_id: str or None, **optional) -> dict:
+        # the order is identified either by its exchange id or by its client id
+        kwargs = {'symbol': symbol.upper()}
+        if order_id:
+            kwargs['orderId'] = order_id
+        else:
+            kwargs['origClientOrderId'] = orig_client_order_id
+        kwargs.update((name, value) for name, value in optional.items() if value)
+        return kwargs
+
     @staticmethod
     async def _handle_errors(func, *args, **kwargs):
         try:
@@ -363,6 +480,17 @@ class BinanceAPI(BaseAPI):
         except BinanceAPIException as e:
             if 'Unknown order sent' in e.message:
                 raise BaseAPI.OrderNotFound
+            if e.status_code == 429:
+                try:
+                    retry_after = float(e.response.headers['Retry-After'])
+                except (KeyError, ValueError, AttributeError):
+                    retry_after = None
+                raise BaseAPI.TooManyRequests(e.message, retry_after)
+            if e.status_code == 418:
+                # IP is banned for minutes, retrying now only prolongs the ban
+                raise BaseAPI.Unavailable(e.message)
+            if e.code in BinanceAPI.UNRECOVERABLE_ERROR_CODES:
+                raise BaseAPI.ErrorNoRetry(e.message)
             raise BaseAPI.Error(e.message)
 
 
@@ -373,22 +501,39 @@ async def main():
         config.get('Exchange', 'APIKey'),
         config.get('Exchange', 'APISecret')
     )
-    funcs = [
+    independent = [
         api.time(),
         api.exchange_info(),
         api.depth(symbol='ethbtc', limit=5),
         api.test_order(symbol='ethbtc', side='BUY', order_type='MARKET', quantity=0.5),
-        api.order_info(symbol='ethbtc', order_id=56577459),
-        api.cancel_order(symbol='ethbtc', order_id=56577459),
         api.account()
     ]
-    for func in funcs:
-        try:
-            result = await func
-        except BinanceAPI.Error as e:
-            result = e.message
-        print(f'{func.__name__}():\t{result}')
+    # these are on the same order, so the result of cancelling depends on what's been checked before
+    dependent = [
+        api.order_info(symbol='ethbtc', order_id=56577459),
+        api.cancel_order(symbol='ethbtc', order_id=56577459)
+    ]
 
+    async def one_by_one(funcs: list) -> list:
+        results = []
+        for func in funcs:
+            try:
+                results.append(await func)
+            except BinanceAPI.Error as e:
+                results.append(e)
+        return results
+
+    # independent ones all at once, alongside the dependent ones one by one
+    independent_results, dependent_results = await asyncio.gather(
+        asyncio.gather(*independent, return_exceptions=True),
+        one_by_one(dependent)
+    )
+    for func, result in zip(independent + dependent, independent_results + dependent_results):
+        if isinstance(result, BinanceAPI.Error):
+            result = result.message
+        elif isinstance(result, BaseException):
+            raise result
+        print(f'{func.__name__}():\t{result}')
 
 if __name__ == '__main__':
     loop = asyncio.get_event_loop()
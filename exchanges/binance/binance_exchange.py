@@ -1,10 +1,15 @@
+import asyncio
 from decimal import Decimal
 from typing import Dict, Tuple
 from exchanges.base_exchange import BaseExchange
 from exchanges.base_orderbook import BaseOrderbook
+from helpers import LRUDict, dispatcher_connect_threadsafe, run_async_repeatedly
 from .binance_api import BinanceAPI
 from .binance_websocket import BinanceWebsocket
 from .binance_orderbook import BinanceOrderbook
+from .binance_user_stream import BinanceUserStream
+from logger import get_logger
+logger = get_logger(__name__)
 
 
 class BinanceExchange(BaseExchange):
@@ -13,12 +18,30 @@ class BinanceExchange(BaseExchange):
         self._api = api
         self._symbols_info = {}
         self._websockets = []
+        self._listen_key = None
+        self._user_stream = None
+        self._disconnect_from_user_stream = None
+        self._stop_listen_key_keepalive = None
+        self._listen_key_keepalive_interval = 30 * 60   # seconds
+        self._stop_connection_keepalive = None
+        self._connection_keepalive_interval = 30    # seconds, binance drops idle connections after a minute or so
+        # latest known state of our orders from the user stream: {(symbol, order_id): order data like in REST}
+        self._order_updates = LRUDict(maxsize=1000)
+        self._order_update_events = {}     # {(symbol, order_id): asyncio.Event}, for those waiting for an update
+        self._order_update_waiters = {}    # {(symbol, order_id): int}, how many are waiting on each event
 
     @classmethod
     async def create(cls, api_key: str, api_secret: str):
         api = await BinanceAPI.create(api_key, api_secret)
         self = cls(api)
-        await self._load_symbols_info()
+        await asyncio.gather(self._load_symbols_info(), self._start_user_stream())
+        # keep a connection to the API open, so that orders don't have to wait for a new one to be established
+        self._stop_connection_keepalive = run_async_repeatedly(
+            self._keepalive_connection,
+            self._connection_keepalive_interval,
+            asyncio.get_event_loop(),
+            'BinanceConnectionKeepalive'
+        )
         return self
 
     async def load_balances(self) -> Dict[str, Decimal]:
@@ -30,7 +53,11 @@ class BinanceExchange(BaseExchange):
         try:
             for each in info['balances']:
                 asset = each['asset']
-                balances[asset] = Decimal(each['free'])
+                free = each['free']
+                # most of the assets are empty, like '0.00000000', skip them: missing balance means zero
+                if not free.strip('0.'):
+                    continue
+                balances[asset] = Decimal(free)
         except KeyError:
             BinanceExchange.Error(f'Bad data format! Data: {info}')
         except (ValueError, TypeError):
@@ -81,12 +108,40 @@ class BinanceExchange(BaseExchange):
             raise BinanceExchange.Error(e.message)
 
     async def get_order_result(self, symbol: str, order_id: str) -> BaseExchange.OrderResult:
+        # completed orders don't change anymore, if the user stream has told us it's done, no need to ask the API
+        update = self._order_updates.get((symbol, int(order_id)))
+        if update is not None and update['status'] not in ['NEW', 'PARTIALLY_FILLED']:
+            return self._parse_order_result(update)
         try:
             r = await self._api.order_info(symbol, int(order_id), urgency=1)
             return self._parse_order_result(r)
         except BinanceAPI.Error as e:
             raise BinanceExchange.Error(e.message)
 
+    async def wait_order_update(self, symbol: str, order_id: str, timeout: float):
+        if self._user_stream is None:
+            await asyncio.sleep(timeout)
+            return
+        key = (symbol, int(order_id))
+        update = self._order_updates.get(key)
+        if update is not None and update['status'] not in ['NEW', 'PARTIALLY_FILLED']:
+            # already done, nothing to wait for
+            return
+        event = self._order_update_events.get(key)
+        if event is None:
+            event = self._order_update_events[key] = asyncio.Event()
+        self._order_update_waiters[key] = self._order_update_waiters.get(key, 0) + 1
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            # the event is shared, so drop it only when the last one stops waiting
+            self._order_update_waiters[key] -= 1
+            if self._order_update_waiters[key] == 0:
+                del self._order_update_waiters[key]
+                del self._order_update_events[key]
+
     async def cancel_order(self, symbol: str, order_id: str) -> BaseExchange.OrderResult:
         try:
             r = await self._api.cancel_order(symbol, int(order_id), urgency=1)
@@ -96,6 +151,9 @@ class BinanceExchange(BaseExchange):
             raise BinanceExchange.Error(e.message)
         return self._parse_order_result(r)
 
+    def is_available(self) -> bool:
+        return self._api.is_available()
+
     async def measure_ping(self) -> Tuple[int, int, int]:
         try:
             return await self._api.measure_ping()
@@ -103,10 +161,100 @@ class BinanceExchange(BaseExchange):
             raise BinanceExchange.Error(f'Failed to measure ping: {e.message}')
 
     async def stop(self):
+        if self._stop_connection_keepalive is not None:
+            self._stop_connection_keepalive.set()
         for ws in self._websockets:
             ws.stop()
+        await self._stop_user_stream()
         await self._api.stop()
 
+    async def _start_user_stream(self):
+        try:
+            self._listen_key = await self._api.create_listen_key()
+        except BinanceAPI.Error as e:
+            logger.warning(f'User stream is not available, order results will be polled only: {e.message}')
+            return
+        self._user_stream = BinanceUserStream(self._listen_key)
+        disconnect_report = dispatcher_connect_threadsafe(
+            self._on_execution_report, signal='ws_execution_report', sender=self._user_stream
+        )
+        disconnect_expired = dispatcher_connect_threadsafe(
+            self._on_listen_key_expired, signal='ws_listen_key_expired', sender=self._user_stream
+        )
+
+        def disconnect():
+            disconnect_report()
+            disconnect_expired()
+        self._disconnect_from_user_stream = disconnect
+        self._user_stream.start()
+        self._stop_listen_key_keepalive = run_async_repeatedly(
+            self._keepalive_listen_key,
+            self._listen_key_keepalive_interval,
+            asyncio.get_event_loop(),
+            'BinanceListenKeyKeepalive'
+        )
+
+    async def _stop_user_stream(self):
+        if self._user_stream is None:
+            return
+        self._stop_listen_key_keepalive.set()
+        self._disconnect_from_user_stream()
+        self._user_stream.stop()
+        try:
+            await self._api.close_listen_key(self._listen_key)
+        except BinanceAPI.Error as e:
+            logger.warning(f'Failed to close the user stream: {e.message}')
+        self._user_stream = None
+
+    async def _keepalive_listen_key(self):
+        try:
+            await self._api.keepalive_listen_key(self._listen_key)
+            return
+        except BinanceAPI.Error as e:
+            logger.warning(f'Failed to keep the user stream alive: {e.message}')
+        # the key has probably expired, a new one is needed to keep receiving order updates
+        await self._renew_listen_key()
+
+    async def _renew_listen_key(self):
+        try:
+            listen_key = await self._api.create_listen_key()
+        except BinanceAPI.Error as e:
+            logger.warning(f'Failed to renew the user stream: {e.message}')
+            return
+        if self._user_stream is None:
+            # stopped meanwhile
+            return
+        logger.info('User stream renewed with a new listen key')
+        self._listen_key = listen_key
+        self._user_stream.set_listen_key(listen_key)
+
+    def _on_listen_key_expired(self, sender):
+        # the stream reconnects by itself, but with the expired key that won't help
+        if self._user_stream is not None:
+            asyncio.ensure_future(self._renew_listen_key())
+
+    async def _keepalive_connection(self):
+        try:
+            await self._api.ping()
+        except BinanceAPI.Error as e:
+            logger.warning(f'Keepalive ping failed: {e.message}')
+
+    def _on_execution_report(self, sender, report: dict):
+        # keep it in the same format as the API returns, to parse it the same way
+        self._order_updates[(report['s'], report['i'])] = {
+            'symbol': report['s'],
+            'orderId': report['i'],
+            'side': report['S'],
+            'price': report['p'],
+            'origQty': report['q'],
+            'executedQty': report['z'],
+            'cummulativeQuoteQty': report['Z'],
+            'status': report['X']
+        }
+        event = self._order_update_events.get((report['s'], report['i']))
+        if event is not None:
+            event.set()
+
     def _parse_order_result(self, result: dict) -> BaseExchange.OrderResult:
         status = result['status']
         if status == 'CANCELED':
@@ -144,15 +292,18 @@ class BinanceExchange(BaseExchange):
                 'amount_step': None,
                 'min_total': None,
             }
-            for f in symbol['filters']:
-                if f['filterType'] == 'PRICE_FILTER':
-                    info['min_price'] = Decimal(f['minPrice']).normalize()
-                    info['max_price'] = Decimal(f['maxPrice']).normalize()
-                    info['price_step'] = Decimal(f['tickSize']).normalize()
-                elif f['filterType'] == 'LOT_SIZE':
-                    info['min_amount'] = Decimal(f['minQty']).normalize()
-                    info['max_amount'] = Decimal(f['maxQty']).normalize()
-                    info['amount_step'] = Decimal(f['stepSize']).normalize()
-                elif f['filterType'] == 'MIN_NOTIONAL':
-                    info['min_total'] = Decimal(f['minNotional']).normalize()
+            filters = {f['filterType']: f for f in symbol['filters']}
+            f = filters.get('PRICE_FILTER')
+            if f is not None:
+                info['min_price'] = Decimal(f['minPrice']).normalize()
+                info['max_price'] = Decimal(f['maxPrice']).normalize()
+                info['price_step'] = Decimal(f['tickSize']).normalize()
+            f = filters.get('LOT_SIZE')
+            if f is not None:
+                info['min_amount'] = Decimal(f['minQty']).normalize()
+                info['max_amount'] = Decimal(f['maxQty']).normalize()
+                info['amount_step'] = Decimal(f['stepSize']).normalize()
+            f = filters.get('MIN_NOTIONAL')
+            if f is not None:
+                info['min_total'] = Decimal(f['minNotional']).normalize()
             self._symbols_info[symbol_name] = info
@@ -9,6 +9,8 @@ logger = get_logger(__name__)
 class BinanceOrderbook(BaseOrderbook):
     def __init__(self, symbol: str, websocket: BinanceWebsocket):
         super().__init__(symbol)
+        self._bids_raw = None   # last applied snapshot side, as received
+        self._asks_raw = None
         self._websocket = websocket
         self._websocket.add_symbol(self._symbol)
         dispatcher.connect(
@@ -36,6 +38,8 @@ class BinanceOrderbook(BaseOrderbook):
 
     def _on_ws_closed(self):
         self._valid = False
+        self._bids_raw = None
+        self._asks_raw = None
 
     def _on_ws_depth(self, sender, symbol: dict, data: dict):
         if symbol != self._symbol:
@@ -56,6 +60,9 @@ class BinanceOrderbook(BaseOrderbook):
         return changed
 
     def _update_bids(self, bids_list) -> bool:
+        if bids_list == self._bids_raw:
+            # nothing has changed since the last snapshot, no need to parse it again
+            return self._bids_changed
         not_mentioned = set(self._bids)
         for each in bids_list:
             price = Decimal(each[0])
@@ -71,9 +78,13 @@ class BinanceOrderbook(BaseOrderbook):
             self._bids_prices.discard(price)
             self._bids.pop(price, None)
             self._bids_changed = True
+        self._bids_raw = bids_list
         return self._bids_changed
 
     def _update_asks(self, asks_list):
+        if asks_list == self._asks_raw:
+            # nothing has changed since the last snapshot, no need to parse it again
+            return self._asks_changed
         not_mentioned = set(self._asks)
         for each in asks_list:
             price = Decimal(each[0])
@@ -89,4 +100,5 @@ class BinanceOrderbook(BaseOrderbook):
             self._asks_prices.discard(price)
             self._asks.pop(price, None)
             self._asks_changed = True
+        self._asks_raw = asks_list
         return self._asks_changed
@@ -0,0 +1,96 @@
+import websocket
+import threading
+import ssl
+import time
+import orjson
+from pydispatch import dispatcher
+from logger import get_logger
+logger = get_logger(__name__)
+
+
+class BinanceUserStream:
+    def __init__(self, listen_key: str):
+        self._ws = None
+        self._thread = None
+        self._listen_key = listen_key
+        self._stop_now = threading.Event()
+        self._reconnect_delay = 0
+        self._reconnect_delay_min = 1     # seconds, doubles after each failed connection
+        self._reconnect_delay_max = 60    # seconds
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='BinanceUserStream')
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def set_listen_key(self, listen_key: str):
+        # reconnect with the new key
+        self._listen_key = listen_key
+        if self._ws is not None:
+            self._ws.close()
+
+    def on_ws_message(self, message: str):
+        # logger.info(f'User stream message: {message}')
+        message_parsed = orjson.loads(message)
+        event = message_parsed.get('e')
+        if event == 'executionReport':
+            dispatcher.send(
+                signal='ws_execution_report',
+                sender=self,
+                report=message_parsed
+            )
+        elif event == 'listenKeyExpired':
+            logger.info('User stream listen key has expired')
+            dispatcher.send(signal='ws_listen_key_expired', sender=self)
+
+    def on_ws_error(self, error=None):
+        logger.info(f'User stream error: {error}')
+
+    def on_ws_close(self):
+        logger.info('User stream closed')
+
+    def on_ws_open(self):
+        logger.info('User stream open')
+        self._reconnect_delay = 0
+
+    def run(self):
+        logger.info('BinanceUserStream starting...')
+        while not self._stop_now.is_set():
+            # the key may have been replaced since the last connection
+            wss_url = f'wss://stream.binance.com:9443/ws/{self._listen_key}'
+            self._ws = websocket.WebSocketApp(
+                wss_url,
+                on_message=self.on_ws_message,
+                on_error=self.on_ws_error,
+                on_close=self.on_ws_close
+            )
+            self._ws.on_open = self.on_ws_open
+            self._ws.run_forever(sslopt={"cert_reqs": ssl.CERT_NONE})
+            if not self._stop_now.is_set():
+                # back off while the stream can't connect, not to hammer the endpoint
+                self._reconnect_delay = min(
+                    max(self._reconnect_delay * 2, self._reconnect_delay_min),
+                    self._reconnect_delay_max
+                )
+                logger.info(f'Restarting the user stream in {self._reconnect_delay} s')
+                self._stop_now.wait(self._reconnect_delay)
+        logger.info('BinanceUserStream stopped')
+
+    def stop(self):
+        self._stop_now.set()
+        self._ws.close()
+        self._thread.join()
+
+
+def test_on_execution_report(sender, report: dict):
+    logger.info(f'Execution report: {report}')
+
+
+if __name__ == "__main__":
+    import sys
+    # pass a listen key obtained via BinanceAPI.create_listen_key()
+    stream = BinanceUserStream(sys.argv[1])
+    dispatcher.connect(test_on_execution_report, signal='ws_execution_report', sender=dispatcher.Any)
+    stream.start()
+    time.sleep(60)
+    stream.stop()
@@ -2,7 +2,7 @@ import websocket
 import threading
 import ssl
 import time
-import json
+import orjson
 from pydispatch import dispatcher
 from logger import get_logger
 logger = get_logger(__name__)
@@ -13,10 +13,12 @@ class BinanceWebsocket:
         self._ws = None
         self._thread = None
         self._symbols = set()
+        self._depth_signals = {}    # {stream symbol: (signal name, symbol)}
         self._stop_now = False
 
     def add_symbol(self, symbol: str):
         self._symbols.add(symbol)
+        self._depth_signals[symbol.lower()] = (f'ws_depth_{symbol.lower()}', symbol.upper())
 
     def start(self):
         self._thread = threading.Thread(target=self.run, name='BinanceWebsocket')
@@ -25,13 +27,18 @@ class BinanceWebsocket:
 
     def on_ws_message(self, message: str):
         # logger.info(f'Websocket message: {message}')
-        message_parsed = json.loads(message)
-        symbol, stream = message_parsed['stream'].split('@', 1)
+        message_parsed = orjson.loads(message)
+        stream_symbol, stream = message_parsed['stream'].split('@', 1)
         if stream == 'depth20@100ms':
+            try:
+                signal, symbol = self._depth_signals[stream_symbol]
+            except KeyError:
+                logger.warning(f'Websocket message for unknown symbol: {stream_symbol}')
+                return
             dispatcher.send(
-                signal=f'ws_depth_{symbol}',
+                signal=signal,
                 sender=self,
-                symbol=symbol.upper(),
+                symbol=symbol,
                 data=message_parsed['data']
             )
 
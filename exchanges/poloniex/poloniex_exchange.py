@@ -1,3 +1,4 @@
+import asyncio
 from decimal import Decimal, DivisionByZero, ROUND_UP
 from typing import Dict, Tuple
 from helpers import LRUDict
@@ -31,13 +32,11 @@ class PoloniexExchange(BaseExchange):
 
     async def load_balances(self) -> Dict[str, Decimal]:
         try:
-            r = await self._api.balances()
+            # update symbols info as well, as rates change and thus min amounts change as well
+            r, _ = await asyncio.gather(self._api.balances(), self._load_symbols_info())
         except PoloniexAPI.Error as e:
             raise PoloniexExchange.Error(e.message)
-        balances = {asset: Decimal(balance) for asset, balance in r.items()}
-        # update symbols info as well, as rates change and thus min amounts change as well
-        await self._load_symbols_info()
-        return balances
+        return {asset: Decimal(balance) for asset, balance in r.items()}
 
     def get_symbols_info(self):
         return self._symbols_info
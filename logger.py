@@ -15,6 +15,14 @@ handler_console = logging.StreamHandler()
 handler_console.setLevel(logging.INFO)
 handler_console.setFormatter(log_formatter_info)
 
+# all the handlers in use, uncomment handler_debug to write the debug log
+handlers = [
+    # handler_debug,
+    handler_console,
+]
+# records below this level would be dropped by every handler, so loggers don't even create them
+log_level = min(handler.level for handler in handlers)
+
 
 def get_logger(name):
     """
@@ -24,12 +32,10 @@ def get_logger(name):
     :return: logger
     """
     logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
-
-    # writing a detailed debug log to debug.log file
-    # logger.addHandler(handler_debug)
+    logger.setLevel(log_level)
 
-    # writing a general log to console
-    logger.addHandler(handler_console)
+    # writing a detailed debug log to debug.log file and a general log to console
+    for handler in handlers:
+        logger.addHandler(handler)
 
     return logger
@@ -63,13 +63,15 @@ class TriangularArbitrage:
         self._is_processing = False
         actions = sender.get_raw_action_list()
         result = sender.get_result()
+        # the executor is done whether there is a result or not
+        self._executor = None
         if result is None:
             logger.info('No result, no aftermath')
+            self._aftermath_done.set()
             return
         aftermath = Aftermath(self._exchange, actions, result)
         dispatcher.connect(self._on_aftermath_done, signal='aftermath_done', sender=aftermath)
         asyncio.ensure_future(aftermath.run())
-        self._executor = None
         # circuit breaker
         if result.scenario == 'normal':
             self._were_not_normal = 0
@@ -0,0 +1,56 @@
+import asyncio
+from decimal import Decimal
+import pytest
+from arbitrage_detector import ArbitrageDetector
+
+
+class FakeExchange:
+    """No symbols, no orderbooks, just enough to create the detector"""
+
+    def get_symbols_info(self) -> dict:
+        return {}
+
+    def make_symbol(self, base: str, quote: str) -> str:
+        return base + quote
+
+    def run_orderbooks(self, symbols: dict) -> dict:
+        return {}
+
+
+@pytest.fixture
+def detector():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    detector = ArbitrageDetector(
+        FakeExchange(), fee=Decimal('0.001'), min_profit=Decimal('0.001'),
+        min_depth=1, min_age=0, reduce_factor=Decimal('0.9')
+    )
+    yield detector
+    detector.stop()
+    asyncio.set_event_loop(None)
+    loop.close()
+
+
+def book(price: str, *amounts: str) -> list:
+    return [(Decimal(price), Decimal(amount)) for amount in amounts]
+
+
+def test_walk_sell_buy_sell_absorbs_rounding_on_28_digit_amounts(detector):
+    # with the full Decimal precision used up, a counted amount overshoots its level by a digit
+    bids_yz = book('0.0505', '4.587446664679442783279236101', '9.353504615981492602744002071')
+    asks_xz = book('0.01', '4.75198010498973021627321341', '9.478165715634705003120033969')
+    bids_xy = book('0.2', '4.070311795229647770154454505', '6.022095538188301712789106321')
+    amounts, prices, depth = detector._walk_sell_buy_sell(bids_yz, asks_xz, bids_xy)
+    assert amounts['x_buy'] <= sum(amount for _, amount in asks_xz)
+    assert amounts['z_profit'] > 0
+    assert depth > 1
+
+
+def test_walk_buy_sell_buy_absorbs_rounding_on_28_digit_amounts(detector):
+    asks_yz = book('0.05', '1.523051057724425521478161671', '3.122958461037784619405688492')
+    bids_xz = book('0.0101', '1.12294995649963822367322072', '6.864574190961124304631385479')
+    asks_xy = book('0.2', '7.979907521137475108669627367', '4.219110694076954446503556497')
+    amounts, prices, depth = detector._walk_buy_sell_buy(asks_yz, bids_xz, asks_xy)
+    assert amounts['x_sell'] <= sum(amount for _, amount in bids_xz)
+    assert amounts['z_profit'] > 0
+    assert depth > 1
@@ -0,0 +1,69 @@
+import asyncio
+import json
+import pytest
+from exchanges.base_api import BaseAPI
+from exchanges.binance.binance_api import BinanceAPI
+from exchanges.binance.binance.exceptions import BinanceAPIException
+
+
+def api_error(code: int, msg: str) -> BinanceAPIException:
+    return BinanceAPIException(None, 400, json.dumps({'code': code, 'msg': msg}))
+
+
+class FakeClient:
+    """Places the first order only after its request has timed out on our side"""
+
+    def __init__(self, lands_late: bool = True):
+        self.orders = {}    # {client order id: order}
+        self.creates = 0
+        self._in_flight = None
+        self._lands_late = lands_late
+
+    async def create_order(self, **params):
+        self.creates += 1
+        if self.creates == 1:
+            self._in_flight = params
+            raise asyncio.TimeoutError
+        if params['newClientOrderId'] in self.orders:
+            raise api_error(-2010, 'Duplicate order sent.')
+        return self._place(params)
+
+    async def get_order(self, symbol: str, origClientOrderId: str):
+        order = self.orders.get(origClientOrderId)
+        if order is None:
+            if self._in_flight is not None and self._lands_late:
+                # the timed out order reaches the book right after we've looked for it
+                self._place(self._in_flight)
+                self._in_flight = None
+            raise api_error(-2013, 'Order does not exist.')
+        return order
+
+    def _place(self, params: dict) -> dict:
+        order = {'orderId': 1, 'clientOrderId': params['newClientOrderId'], 'status': 'NEW'}
+        self.orders[params['newClientOrderId']] = order
+        return order
+
+
+def test_create_order_finds_order_rejected_as_duplicate_on_retry():
+    client = FakeClient()
+    api = BinanceAPI(client)
+    order = asyncio.run(api.create_order('ETHBTC', 'BUY', 'LIMIT', '1', price='0.05'))
+    assert order['orderId'] == 1
+    assert client.creates == 2
+    assert len(client.orders) == 1
+
+
+class RejectingClient(FakeClient):
+    async def create_order(self, **params):
+        self.creates += 1
+        if self.creates == 1:
+            raise asyncio.TimeoutError
+        raise api_error(-2010, 'Account has insufficient balance for requested action.')
+
+
+def test_create_order_raises_when_rejected_order_is_not_found():
+    client = RejectingClient()
+    api = BinanceAPI(client)
+    with pytest.raises(BaseAPI.ErrorNoRetry):
+        asyncio.run(api.create_order('ETHBTC', 'BUY', 'LIMIT', '1', price='0.05'))
+    assert client.creates == 2